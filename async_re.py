@@ -19,14 +19,16 @@ Melissa Romanus
 import os
 import sys
 import time
-import pickle
 import random
 import shutil
 import logging, logging.config
 
 from configobj import ConfigObj
+from numpy import asarray
 
 from gibbs_sampling import *
+from replica_status import replica_status_table, status_journal
+from input_template import render_template
 
 
 
@@ -89,36 +91,43 @@ class async_re(object):
     def _setLogger(self):
         self.logger = logging.getLogger("async_re")
 
-    def __getattribute__(self, name):
-        if name == 'replicas_waiting':
-            # Return a list of replica indices of replicas in a wait state.
-            return [k for k in range(self.nreplicas)
-                    if self.status[k]['running_status'] == 'W']
-        elif name == 'states_waiting':
-            # Return a list of state ids of replicas in a wait state.
-            return [self.status[k]['stateid_current']
-                    for k in self.replicas_waiting]
-        elif name == 'replicas_waiting_to_exchange':
-            # Return a list of replica indices of replicas in a wait state that
-            # have ALSO completed at least one cycle.
-            return [k for k in range(self.nreplicas)
-                    if (self.status[k]['running_status'] == 'W' and
-                        self.status[k]['cycle_current'] > 1)]
-        elif name == 'states_waiting_to_exchange':
-            # Return a list of state ids of replicas in a wait state that have
-            # ALSO completed at least one cycle.
-            return [self.status[k]['stateid_current']
-                    for k in self.replicas_waiting_to_exchange]
-        elif name == 'waiting':
-            return len(self.replicas_waiting)
-        elif name == 'replicas_running':
-            # Return a list of replica indices of replicas in a running state.
-            return [k for k in range(self.nreplicas)
-                    if self.status[k]['running_status'] == 'R']
-        elif name == 'running':
-            return len(self.replicas_running)
-        else:
-            return object.__getattribute__(self,name)
+    @property
+    def replicas_waiting(self):
+        # Return a list of replica indices of replicas in a wait state.
+        return self.status.replicas('W')
+
+    @property
+    def states_waiting(self):
+        # Return a list of state ids of replicas in a wait state.
+        return [self.status[k]['stateid_current']
+                for k in self.replicas_waiting]
+
+    @property
+    def replicas_waiting_to_exchange(self):
+        # Return a list of replica indices of replicas in a wait state that
+        # have ALSO completed at least one cycle.
+        return [k for k in self.status.replicas('W')
+                if self.status[k]['cycle_current'] > 1]
+
+    @property
+    def states_waiting_to_exchange(self):
+        # Return a list of state ids of replicas in a wait state that have
+        # ALSO completed at least one cycle.
+        return [self.status[k]['stateid_current']
+                for k in self.replicas_waiting_to_exchange]
+
+    @property
+    def waiting(self):
+        return self.status.count('W')
+
+    @property
+    def replicas_running(self):
+        # Return a list of replica indices of replicas in a running state.
+        return self.status.replicas('R')
+
+    @property
+    def running(self):
+        return self.status.count('R')
 
     def _printStatus(self):
         """Print a report of the input parameters."""
@@ -144,8 +153,10 @@ class async_re(object):
         self.transport_mechanism = self.keywords.get('JOB_TRANSPORT')
         if self.transport_mechanism is None:
             self._exit('JOB_TRANSPORT needs to be specified')
-        #only SSH and BOINC are supported for now
-        if self.transport_mechanism != "SSH" and self.transport_mechanism != "BOINC" and self.transport_mechanism != "CONDOR":
+        #only SSH, BOINC, CONDOR, LOCAL and PILOT are supported for now
+        if (self.transport_mechanism != "SSH" and self.transport_mechanism != "BOINC" and
+            self.transport_mechanism != "CONDOR" and self.transport_mechanism != "LOCAL" and
+            self.transport_mechanism != "PILOT"):
             self._exit("unknown JOB_TRANSPORT %s" % self.transport_mechanism)
         # reset job transport
         self.transport = None
@@ -222,6 +233,18 @@ class async_re(object):
         else:
             self._exit("unknown exchange method %s" % self.exchangeMethod)
 
+        # event-driven scheduling: harvest, exchange and relaunch replicas
+        # as soon as they complete rather than every CYCLE_TIME seconds
+        self.event_driven = False
+        if self.keywords.get('EVENT_DRIVEN') is None:
+            self.event_driven = False
+        elif self.keywords.get('EVENT_DRIVEN').lower() == 'yes':
+            self.event_driven = True
+        elif self.keywords.get('EVENT_DRIVEN').lower() == 'no':
+            self.event_driven = False
+        else:
+            self._exit("unknown value for event driven switch %s" % self.keywords.get('EVENT_DRIVEN'))
+
         # execution time in minutes
         self.walltime = float(self.keywords.get('WALL_TIME'))
         if self.walltime is None:
@@ -285,6 +308,17 @@ class async_re(object):
         shutil.copy(real_filename,link_filename)
         os.chdir('..')
 
+    def _writeInpFile(self, template, inpfile, values):
+        """
+        Writes the input file inpfile from the template file with the @name@
+        placeholders replaced by values[name]. Templates are compiled once and
+        cached, see input_template.
+        """
+        tbuffer = render_template(template, values, self._openfile)
+        ofile = self._openfile(inpfile, "w")
+        ofile.write(tbuffer)
+        ofile.close()
+
     def setupJob(self):
         """
         If RE_SETUP='yes' creates and populates subdirectories, one for each
@@ -300,7 +334,7 @@ class async_re(object):
         if self.transport_mechanism == "SSH":
             from ssh_transport import ssh_transport
             # creates SSH transport
-            self.transport = ssh_transport(self.basename, self.compute_nodes, [ i for i in range(self.nreplicas)])
+            self.transport = ssh_transport(self.basename, self.compute_nodes, [ i for i in range(self.nreplicas)], self.keywords)
             #self.transport = ssh_transport(self.basename, self.compute_nodes, self.nreplicas)
         elif self.transport_mechanism == "BOINC":
             from boinc_transport import boinc_transport
@@ -313,6 +347,16 @@ class async_re(object):
             from condor_transport import condor_transport
             self.transport = condor_transport(self.basename, self.nreplicas)
 
+        elif self.transport_mechanism == "LOCAL":
+            # creates a transport running replicas as local subprocesses
+            from local_transport import local_transport
+            self.transport = local_transport(self.basename, self.keywords, self.nreplicas)
+
+        elif self.transport_mechanism == "PILOT":
+            # creates a transport handing out jobs to pilot workers
+            from pilot_transport import pilot_transport
+            self.transport = pilot_transport(self.basename, self.keywords, self.nreplicas)
+
         else:
             self._exit("Job transport is not specified.")
 
@@ -327,6 +371,14 @@ class async_re(object):
         else:
             setup = True
 
+        # status transitions are journaled to BASENAME.stat.journal and
+        # folded into BASENAME.stat every STATUS_COMPACT_INTERVAL records
+        if self.keywords.get('STATUS_COMPACT_INTERVAL') is None:
+            compact_interval = 10*self.nreplicas
+        else:
+            compact_interval = int(self.keywords.get('STATUS_COMPACT_INTERVAL'))
+        self.status_journal = status_journal(self.basename, compact_interval, _open)
+
         if setup:
             # create replicas directories r1, r2, etc.
             for k in range(self.nreplicas):
@@ -342,10 +394,11 @@ class async_re(object):
                     for k in range(self.nreplicas):
                         self._linkReplicaFile(file,file,k)
             # create status table
-            self.status = [{'stateid_current': k, 'running_status': 'W',
-                            'cycle_current': 1} for k in range(self.nreplicas)]
+            self.status = replica_status_table(
+                [{'stateid_current': k, 'running_status': 'W',
+                  'cycle_current': 1} for k in range(self.nreplicas)])
             # save status tables
-            self._write_status()
+            self._write_status(snapshot=True)
             # create input files no. 1
             for k in range(self.nreplicas):
                 self._buildInpFile(k)
@@ -395,6 +448,17 @@ class async_re(object):
         start_time = time.time()
         end_time = (start_time + 60*(self.walltime - replica_run_time) -
                     cycle_time - 10)
+        if self.event_driven:
+            self._scheduleJobs_event(end_time, min_time, cycle_time)
+        else:
+            self._scheduleJobs_polling(end_time, min_time, cycle_time)
+        self.updateStatus()
+        self.print_status()
+        self.waitJob(min_time, cycle_time)
+        self._write_status(snapshot=True)
+        self.cleanJob()
+
+    def _scheduleJobs_polling(self, end_time, min_time, cycle_time):
         while time.time() < end_time:
             # comment out by Junchao to set the minimum time
             # time.sleep(1)
@@ -411,42 +475,62 @@ class async_re(object):
             self.print_status()
             if self.exchange:
                 self.doExchanges()
-        self.updateStatus()
-        self.print_status()
-        self.waitJob()
-        self.cleanJob()
 
-    def waitJob(self):
+    def _scheduleJobs_event(self, end_time, min_time, cycle_time):
+        """
+        Event-driven scheduling loop: replicas that complete a cycle are
+        harvested, exchanged and relaunched right away. ProcessJobQueue()
+        returns as soon as a running replica completes, so cycle_time is only
+        an upper bound on the time spent waiting.
+        """
+        while time.time() < end_time:
+            self.updateStatus()
+            if self.exchange:
+                self.doExchanges()
+            self.launchJobs()
+            self.print_status()
+
+            self.transport.ProcessJobQueue(min_time, cycle_time,
+                                           return_on_completion=True)
+
+    def waitJob(self, min_time=1, cycle_time=30.0):
         # wait until all jobs are complete
         completed = False
         while not completed:
             self.updateStatus()
-            completed = True
-            for k in range(self.nreplicas):
-                if self.status[k]['running_status'] == "R":
-                    completed = False
-            time.sleep(1)
+            completed = (self.running == 0)
+            if self.event_driven:
+                # the last pass of the event-driven loop may leave jobs in
+                # the queue of the transport, which starts them only from
+                # ProcessJobQueue()
+                if not completed:
+                    self.transport.ProcessJobQueue(min_time, cycle_time,
+                                                   return_on_completion=True)
+            else:
+                time.sleep(1)
 
     def cleanJob(self):
         return
 
-    def _write_status(self):
+    def _write_status(self, snapshot=False):
         """
-        Pickle the current state of the RE job and write to in BASENAME.stat.
+        Save the current state of the RE job. Replicas whose status changed
+        are appended to the BASENAME.stat.journal journal, which is
+        periodically folded into the pickled snapshot in BASENAME.stat. If
+        snapshot is set, the snapshot is written right away.
         """
-        status_file = '%s.stat'%self.basename
-        f = _open(status_file,'w')
-        pickle.dump(self.status,f)
-        f.close()
+        if snapshot:
+            self.status_journal.snapshot(self.status)
+        else:
+            self.status_journal.append(self.status)
 
     def _read_status(self):
         """
-        Unpickle and load the current state of the RE job from BASENAME.stat.
+        Load the current state of the RE job from the BASENAME.stat snapshot
+        and the BASENAME.stat.journal journal, and start a new snapshot.
         """
-        status_file = '%s.stat'%self.basename
-        f = _open(status_file,'r')
-        self.status = pickle.load(f)
-        f.close()
+        self.status = replica_status_table(self.status_journal.read())
+        self._write_status(snapshot=True)
 
     def print_status(self):
         """
@@ -540,11 +624,15 @@ class async_re(object):
             wait = self.replicas_waiting
             random.shuffle(wait)
             n = min(jobs_to_launch,len(wait))
+            batch = []
             for k in wait[0:n]:
                 self.logger.info('Launching replica %d cycle %d', k, self.status[k]['cycle_current'])
-                # the _launchReplica function is implemented by
+                # the _buildJobInfo function is implemented by
                 # MD engine modules
-                status = self._launchReplica(k,self.status[k]['cycle_current'])
+                batch.append((k, self._buildJobInfo(k,self.status[k]['cycle_current'])))
+            # the transport submits the whole batch at once where it can
+            handles = self.transport.launchJobs(batch)
+            for (k, job_info), status in zip(batch, handles):
                 if status != None:
                     self.status[k]['running_status'] = 'R'
 
@@ -571,6 +659,9 @@ class async_re(object):
         matrix_start_time = time.time()
         swap_matrix = self._computeSwapMatrix(replicas_to_exchange,
                                               states_to_exchange)
+        # the sampling routines index full swap matrices with numpy arrays
+        if not isinstance(swap_matrix, compact_swap_matrix):
+            swap_matrix = asarray(swap_matrix)
         matrix_time = time.time() - matrix_start_time
 
         sampling_start_time = time.time()
@@ -3,6 +3,7 @@ import time
 import math
 import random
 import logging
+from numpy import outer, asarray
 from async_re import async_re
 from impact_async_re import impact_job
 
@@ -58,21 +59,13 @@ class bedam_async_re_job(impact_job):
         template = "%s.inp" % basename
         inpfile = "r%d/%s_%d.inp" % (replica, basename, cycle)
         lambd = self.lambdas[stateid]
-        # read template buffer
-        tfile = self._openfile(template, "r")
-        tbuffer = tfile.read()
-        tfile.close()
-        # make modifications
-        tbuffer = tbuffer.replace("@n@",str(cycle))
-        tbuffer = tbuffer.replace("@nm1@",str(cycle-1))
-        tbuffer = tbuffer.replace("@lambda@",lambd)
-        tbuffer = tbuffer.replace("@jobname@",basename)
-        tbuffer = tbuffer.replace("@replica@",str(replica))
-        tbuffer = tbuffer.replace("@cycle@",str(cycle))
-        # write out
-        ofile = self._openfile(inpfile, "w")
-        ofile.write(tbuffer)
-        ofile.close()
+        # fill in template and write out
+        self._writeInpFile(template, inpfile, {"n": str(cycle),
+                                               "nm1": str(cycle-1),
+                                               "lambda": lambd,
+                                               "jobname": basename,
+                                               "replica": str(replica),
+                                               "cycle": str(cycle)})
 
         # update the history status file
         ofile = self._openfile("r%d/state.history" % replica, "a")
@@ -123,11 +116,9 @@ class bedam_async_re_job(impact_job):
         """
         Extracts binding energy from Impact output
         """
-        output_file = "r%s/%s_%d.out" % (repl,self.basename,cycle)
-        datai = self._getImpactData(output_file)
-        nf = len(datai[0])
-        nr = len(datai)
-        return datai[nr-1][nf-1]
+        datai = self._getLastRecord(repl,cycle)
+        nf = len(datai)
+        return datai[nf-1]
 
     def _getPot(self,repl,cycle):
         return float(self._extractLast_BindingEnergy(repl,cycle))
@@ -143,6 +134,11 @@ class bedam_async_re_job(impact_job):
         # This is for binding potential beta*lambda*u
         return self.bedam_beta*par*pot
 
+    def _reduced_energy_block(self,par,pot):
+        # par: lambdas of the states
+        # pot: binding energies of the replicas
+        return self.bedam_beta*outer(asarray(par,dtype=float),asarray(pot,dtype=float))
+
 
 if __name__ == '__main__':
 
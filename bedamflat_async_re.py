@@ -3,6 +3,7 @@ import time
 import math
 import random
 import logging
+from numpy import newaxis, asarray
 from async_re import async_re
 from bedamtempt_async_re import bedamtempt_async_re_job
 
@@ -18,17 +19,15 @@ class bedamflat_async_re_job(bedamtempt_async_re_job):
         """
         Extracts binding energy from Impact output
         """
-        output_file = "r%s/%s_%d.out" % (repl,self.basename,cycle)
-        datai = self._getImpactData(output_file)
-        nf = len(datai[0])
-        nr = len(datai)
-        # [nr-1]: last record
+        # last record
+        datai = self._getLastRecord(repl,cycle)
+        nf = len(datai)
         # [nf-2]: lambda (next to last item)
         # [nf-1]: binding energy (last item)
         #    [2]: total energy item (0 is step number and 1 is temperature)
         #
         # (lambda, binding energy,flattening energy,  total energy)
-        return (datai[nr-1][nf-4],datai[nr-1][nf-3],datai[nr-1][nf-1],datai[nr-1][2])
+        return (datai[nf-4],datai[nf-3],datai[nf-1],datai[2])
 
 
     def _getPot(self,repl,cycle):
@@ -68,6 +67,19 @@ class bedamflat_async_re_job(bedamtempt_async_re_job):
         eflat = pot[3]
         return beta*(e0 + lmb*u -lmb_d*eflat)
 
+    def _reduced_energy_block(self,par,pot):
+        # par: (beta,lambda,lambda_d) of the states
+        # pot: (e0,u,lambda_d,eflat) of the replicas
+        par = asarray(par,dtype=float)
+        pot = asarray(pot,dtype=float)
+        beta = par[:,0,newaxis]
+        lmb = par[:,1,newaxis]
+        lmb_d = par[:,2,newaxis]
+        e0 = pot[newaxis,:,0]
+        u = pot[newaxis,:,1]
+        eflat = pot[newaxis,:,3]
+        return beta*(e0 + lmb*u -lmb_d*eflat)
+
 if __name__ == '__main__':
 
     # Parse arguments:
@@ -6,6 +6,7 @@ import math
 import random
 import logging
 import shutil
+from numpy import newaxis, asarray
 from async_re import async_re
 from bedam_async_re import bedam_async_re_job
 from bedam_randomize import bedam_randomize
@@ -68,19 +69,11 @@ class bedamtempt_async_re_job(bedam_async_re_job):
 
         lambd = self.stateparams[stateid]['lambda']
         temperature = self.stateparams[stateid]['temperature']
-        # read template buffer
-        tfile = self._openfile(template, "r")
-        tbuffer = tfile.read()
-        tfile.close()
-        # make modifications
-        tbuffer = tbuffer.replace("@n@",str(cycle))
-        tbuffer = tbuffer.replace("@nm1@",str(cycle-1))
-        tbuffer = tbuffer.replace("@lambda@",lambd)
-        tbuffer = tbuffer.replace("@temperature@",temperature)
-        # write out
-        ofile = self._openfile(inpfile, "w")
-        ofile.write(tbuffer)
-        ofile.close()
+        # fill in template and write out
+        self._writeInpFile(template, inpfile, {"n": str(cycle),
+                                               "nm1": str(cycle-1),
+                                               "lambda": lambd,
+                                               "temperature": temperature})
 
         # pick structure from reservoir if lambda=0
         self.randomize_from_reservoir(replica)
@@ -155,17 +148,15 @@ class bedamtempt_async_re_job(bedam_async_re_job):
         """
         Extracts binding energy from Impact output
         """
-        output_file = "r%s/%s_%d.out" % (repl,self.basename,cycle)
-        datai = self._getImpactData(output_file)
-        nf = len(datai[0])
-        nr = len(datai)
-        # [nr-1]: last record
+        # last record
+        datai = self._getLastRecord(repl,cycle)
+        nf = len(datai)
         # [nf-2]: lambda (next to last item)
         # [nf-1]: binding energy (last item)
         #    [2]: total energy item (0 is step number and 1 is temperature)
         #
         # (lambda, binding energy, total energy)
-        return (datai[nr-1][nf-2],datai[nr-1][nf-1],datai[nr-1][2])
+        return (datai[nf-2],datai[nf-1],datai[2])
 
     def print_status(self):
         """
@@ -212,6 +203,17 @@ class bedamtempt_async_re_job(bedam_async_re_job):
         u = pot[1]
         return beta*(e0 + lmb*u)
 
+    def _reduced_energy_block(self,par,pot):
+        # par: (beta,lambda) of the states
+        # pot: (e0,u) of the replicas
+        par = asarray(par,dtype=float)
+        pot = asarray(pot,dtype=float)
+        beta = par[:,0,newaxis]
+        lmb = par[:,1,newaxis]
+        e0 = pot[newaxis,:,0]
+        u = pot[newaxis,:,1]
+        return beta*(e0 + lmb*u)
+
     def randomize_from_reservoir(self, repl):
         # this is used to randomize ligand/receptor conformations
         # at lambda = 0
@@ -119,19 +119,11 @@ class bedamtempt_schedule_job(bedamtempt_async_re_job):
         self.stateparams[stateid]['lambda'] = lambd
         temperature = self.stateparams[stateid]['temperature']
 
-        # read template buffer
-        tfile = self._openfile(template, "r")
-        tbuffer = tfile.read()
-        tfile.close()
-        # make modifications
-        tbuffer = tbuffer.replace("@n@",str(cycle))
-        tbuffer = tbuffer.replace("@nm1@",str(cycle-1))
-        tbuffer = tbuffer.replace("@lambda@",lambd)
-        tbuffer = tbuffer.replace("@temperature@",temperature)
-        # write out
-        ofile = self._openfile(inpfile, "w")
-        ofile.write(tbuffer)
-        ofile.close()
+        # fill in template and write out
+        self._writeInpFile(template, inpfile, {"n": str(cycle),
+                                               "nm1": str(cycle-1),
+                                               "lambda": lambd,
+                                               "temperature": temperature})
 
         # update the history status file
         ofile = self._openfile("r%d/state.history" % replica, "a")
@@ -0,0 +1,87 @@
+"""
+Database backends for the BOINC job transport
+
+boinc_transport only reads the 'workunit' and 'result' tables of the BOINC
+server database. The backend is selected with BOINC_DATABASE_BACKEND:
+
+   mysql:  the MySQL database of a BOINC server (default); BOINC_DATABASE
+           is the database name, BOINC_DATABASE_USER and
+           BOINC_DATABASE_PASSWORD are required
+   sqlite: a SQLite file with the same schema subset, BOINC_DATABASE is
+           its path; used with boinc_simulator.py to exercise the BOINC path
+           of the scheduler without a BOINC server
+"""
+import sqlite3
+
+
+class mysql_backend(object):
+    """
+    MySQL database of a BOINC server
+    """
+    # query parameter placeholder
+    placeholder = '%s'
+
+    def __init__(self, keywords):
+        # imported here so that MySQLdb is needed only for a real server
+        import MySQLdb
+        self.MySQLdb = MySQLdb
+        self.OperationalError = MySQLdb.OperationalError
+        self.missing = [keyword for keyword in
+                        ('BOINC_DATABASE', 'BOINC_DATABASE_USER', 'BOINC_DATABASE_PASSWORD')
+                        if keywords.get(keyword) is None]
+        self.db_name = keywords.get('BOINC_DATABASE')
+        self.db_user = keywords.get('BOINC_DATABASE_USER')
+        self.db_pwd = keywords.get('BOINC_DATABASE_PASSWORD')
+
+    def connect(self):
+        return self.MySQLdb.connect(user=self.db_user, passwd=self.db_pwd,
+                                    db=self.db_name)
+
+
+class sqlite_backend(object):
+    """
+    SQLite stand-in for the BOINC server database
+    """
+    placeholder = '?'
+    OperationalError = sqlite3.OperationalError
+
+    # the columns of the BOINC tables used by the transport and the
+    # simulator; mod_time is in seconds since the epoch
+    schema = """
+CREATE TABLE IF NOT EXISTS workunit (
+    id INTEGER PRIMARY KEY,
+    name TEXT UNIQUE NOT NULL,
+    xml_doc TEXT,
+    assimilate_state INTEGER NOT NULL DEFAULT 0,
+    mod_time REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS result (
+    id INTEGER PRIMARY KEY,
+    workunitid INTEGER NOT NULL,
+    server_state INTEGER NOT NULL DEFAULT 2,
+    mod_time REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS result_workunitid ON result (workunitid);
+CREATE INDEX IF NOT EXISTS workunit_mod_time ON workunit (mod_time);
+"""
+
+    def __init__(self, keywords):
+        self.missing = [keyword for keyword in ('BOINC_DATABASE',)
+                        if keywords.get(keyword) is None]
+        self.db_name = keywords.get('BOINC_DATABASE')
+
+    def connect(self):
+        return sqlite3.connect(self.db_name, timeout=60)
+
+
+backends = {'mysql': mysql_backend, 'sqlite': sqlite_backend}
+
+
+def create_sqlite_db(filename):
+    """
+    Creates the tables of a SQLite stand-in database if they do not exist.
+    """
+    conn = sqlite3.connect(filename, timeout=60)
+    conn.executescript(sqlite_backend.schema)
+    conn.commit()
+    conn.close()
@@ -0,0 +1,207 @@
+"""
+BOINC server simulator for load testing the BOINC job transport
+
+Drives a SQLite stand-in of the BOINC database (see boinc_db.py) so that
+the BOINC path of the scheduler can be exercised, and its polling cost and
+replica throughput measured, without a BOINC server. Workunits are created
+with one result each (server_state UNSENT = 2); the simulator then moves the
+result to IN_PROGRESS (4) and OVER (5) and the workunit to assimilated
+(assimilate_state = 2), each step after a random latency.
+
+   python boinc_simulator.py init <project dir>
+      creates a fake project directory: the database <project dir>/boinc.db,
+      a no-op bin/stage_file_v2 and bin/create_work_batch, to be used as
+      BOINC_BATCH_EXECUTABLE
+
+   python boinc_simulator.py run <project dir> [options]
+      moves workunits through their states until interrupted; options set
+      the latency distributions, for example --run=exp:60 for exponentially
+      distributed run times with a mean of 60 seconds; see --help
+
+   python boinc_simulator.py create_batch <project dir> <jobname>
+      creates workunits for the "working_directory replica cycle" lines
+      read on stdin and writes "replica workunit_id" lines on stdout
+
+The matching control file settings are:
+
+   JOB_TRANSPORT = 'BOINC'
+   BOINC_PROJECTDIR = '<project dir>'
+   BOINC_DATABASE_BACKEND = 'sqlite'
+   BOINC_DATABASE = '<project dir>/boinc.db'
+   BOINC_BATCH_EXECUTABLE = '<project dir>/bin/create_work_batch'
+"""
+import os
+import sys
+import time
+import random
+import sqlite3
+import optparse
+
+from boinc_db import create_sqlite_db
+
+# server states of results and assimilate states of workunits
+UNSENT = 2
+IN_PROGRESS = 4
+OVER = 5
+ASSIMILATED = 2
+
+
+def latency(spec):
+    """
+    Returns a function sampling delays in seconds from a distribution given
+    as 'fixed:t', 'uniform:a:b' or 'exp:mean'.
+    """
+    words = spec.split(':')
+    kind = words[0]
+    values = [float(word) for word in words[1:]]
+    if kind == 'fixed' and len(values) == 1:
+        return lambda: values[0]
+    if kind == 'uniform' and len(values) == 2:
+        return lambda: random.uniform(values[0], values[1])
+    if kind == 'exp' and len(values) == 1:
+        return lambda: random.expovariate(1.0 / values[0]) if values[0] > 0 else 0.0
+    raise ValueError("unknown latency distribution %s" % spec)
+
+
+def create_workunits(db, jobs, jobname):
+    """
+    Creates a workunit with one unsent result for each (working_directory,
+    replica, cycle) in jobs, in one transaction. Returns their ids.
+    """
+    conn = sqlite3.connect(db, timeout=60)
+    now = time.time()
+    wuids = []
+    for (working_directory, replica, cycle) in jobs:
+        name = "%s_r%s_c%s_%d_%d" % (jobname, replica, cycle, os.getpid(), len(wuids))
+        cur = conn.execute("INSERT INTO workunit (name, xml_doc, assimilate_state, mod_time) "
+                           "VALUES (?, ?, 0, ?)", (name, working_directory, now))
+        wuid = cur.lastrowid
+        conn.execute("INSERT INTO result (workunitid, server_state, mod_time) "
+                     "VALUES (?, ?, ?)", (wuid, UNSENT, now))
+        wuids.append(wuid)
+    conn.commit()
+    conn.close()
+    return wuids
+
+
+class boinc_simulator(object):
+    """
+    Moves the workunits of the database through their states.
+    """
+
+    def __init__(self, db, dispatch, run, assimilate, command=None):
+        # dispatch, run, assimilate: latency samplers of the steps
+        #     UNSENT -> IN_PROGRESS -> OVER -> assimilated
+        # command: optional shell command run in the working directory of a
+        #     workunit when it is assimilated, e.g. to produce output files
+        self.conn = sqlite3.connect(db, timeout=60)
+        self.dispatch = dispatch
+        self.run = run
+        self.assimilate = assimilate
+        self.command = command
+        # time of the next transition of results and workunits in flight
+        self.due = {}
+
+    def _due(self, key, sampler, now):
+        if key not in self.due:
+            self.due[key] = now + sampler()
+        if now >= self.due[key]:
+            del self.due[key]
+            return True
+        return False
+
+    def step(self):
+        """
+        Performs the transitions that are due, returns how many.
+        """
+        now = time.time()
+        ntransitions = 0
+        rows = self.conn.execute("SELECT result.id, result.server_state, workunit.id, workunit.xml_doc "
+                                 "FROM result JOIN workunit ON result.workunitid = workunit.id "
+                                 "WHERE result.server_state != ? OR workunit.assimilate_state != ?",
+                                 (OVER, ASSIMILATED)).fetchall()
+        for (resultid, server_state, wuid, working_directory) in rows:
+            if server_state == UNSENT:
+                if self._due(('r', resultid), self.dispatch, now):
+                    self.conn.execute("UPDATE result SET server_state = ?, mod_time = ? WHERE id = ?",
+                                      (IN_PROGRESS, now, resultid))
+                    ntransitions += 1
+            elif server_state == IN_PROGRESS:
+                if self._due(('r', resultid), self.run, now):
+                    self.conn.execute("UPDATE result SET server_state = ?, mod_time = ? WHERE id = ?",
+                                      (OVER, now, resultid))
+                    ntransitions += 1
+            elif self._due(('w', wuid), self.assimilate, now):
+                if self.command:
+                    os.system("cd %s ; %s" % (working_directory, self.command))
+                self.conn.execute("UPDATE workunit SET assimilate_state = ?, mod_time = ? WHERE id = ?",
+                                  (ASSIMILATED, now, wuid))
+                ntransitions += 1
+        self.conn.commit()
+        return ntransitions
+
+
+def init_project(project_dir):
+    """
+    Creates a fake BOINC project directory for the simulator.
+    """
+    bin_dir = os.path.join(project_dir, "bin")
+    if not os.path.isdir(bin_dir):
+        os.makedirs(bin_dir)
+    create_sqlite_db(os.path.join(project_dir, "boinc.db"))
+    scripts = {"stage_file_v2": "#!/bin/sh\nexit 0\n",
+               "create_work_batch": "#!/bin/sh\nexec %s %s create_batch %s \"$@\"\n" % (
+                   sys.executable, os.path.abspath(__file__), os.path.abspath(project_dir))}
+    for name, text in scripts.items():
+        filename = os.path.join(bin_dir, name)
+        f = open(filename, "w")
+        f.write(text)
+        f.close()
+        os.chmod(filename, 0755)
+
+
+if __name__ == '__main__':
+
+    usage = "%prog init|run|create_batch <project dir> [jobname] [options]"
+    parser = optparse.OptionParser(usage=usage)
+    parser.add_option("--dispatch", default="exp:1",
+                      help="latency of sending a result [default: %default]")
+    parser.add_option("--run", default="exp:30",
+                      help="run time of a result [default: %default]")
+    parser.add_option("--assimilate", default="fixed:1",
+                      help="latency of assimilation [default: %default]")
+    parser.add_option("--interval", type="float", default=0.5,
+                      help="seconds between simulation steps [default: %default]")
+    parser.add_option("--command", default=None,
+                      help="shell command run in the working directory of assimilated workunits")
+    (options, args) = parser.parse_args()
+
+    if len(args) < 2:
+        parser.error("a command and a project directory are required")
+    command = args[0]
+    project_dir = args[1]
+    db = os.path.join(project_dir, "boinc.db")
+
+    if command == 'init':
+        init_project(project_dir)
+    elif command == 'create_batch':
+        if len(args) < 3:
+            parser.error("create_batch requires a job name")
+        jobs = [tuple(line.split()) for line in sys.stdin if len(line.split()) == 3]
+        wuids = create_workunits(db, jobs, args[2])
+        for (working_directory, replica, cycle), wuid in zip(jobs, wuids):
+            print replica, wuid
+    elif command == 'run':
+        simulator = boinc_simulator(db, latency(options.dispatch), latency(options.run),
+                                    latency(options.assimilate), options.command)
+        ntransitions = 0
+        start_time = time.time()
+        try:
+            while True:
+                ntransitions += simulator.step()
+                time.sleep(options.interval)
+        except KeyboardInterrupt:
+            elapsed = time.time() - start_time
+            print "%d transitions in %.1f s" % (ntransitions, elapsed)
+    else:
+        parser.error("unknown command %s" % command)
@@ -6,13 +6,11 @@ import sys
 import time
 import re
 import pickle
-import MySQLdb
 import logging
 import subprocess
 
 from transport import Transport
-
-operational_error = MySQLdb.OperationalError
+from boinc_db import backends
 
 class boinc_transport(Transport):
     """
@@ -41,19 +39,51 @@ class boinc_transport(Transport):
         #sets up lookup table for replica done status
         self.replica_status = dict()
 
-        #set connection with mysql boinc server database
-        if keywords.get('BOINC_DATABASE') is None:
-            self.logger.critical("BOINC transport requires a BOINC_DATABASE")
-            sys.exit(1)
-        if keywords.get('BOINC_DATABASE_USER') is None:
-            self.logger.critical("BOINC transport requires a BOINC_DATABASE_USER")
+        #set connection with the boinc server database, mysql unless
+        #BOINC_DATABASE_BACKEND says otherwise
+        backend = keywords.get('BOINC_DATABASE_BACKEND')
+        if backend is None:
+            backend = 'mysql'
+        if backend not in backends:
+            self.logger.critical("Unknown BOINC_DATABASE_BACKEND %s", backend)
             sys.exit(1)
-        if keywords.get('BOINC_DATABASE_PASSWORD') is None:
-            self.logger.critical("BOINC transport requires a BOINC_DATABASE_PASSWORD")
+        self.db = backends[backend](keywords)
+        for keyword in self.db.missing:
+            self.logger.critical("BOINC transport requires a %s", keyword)
             sys.exit(1)
         self.db_name = keywords.get('BOINC_DATABASE')
-        self.db_user = keywords.get('BOINC_DATABASE_USER')
-        self.db_pwd = keywords.get('BOINC_DATABASE_PASSWORD')
+
+        # persistent connection with the BOINC database, reopened if lost
+        self.boinc_db = None
+
+        # latest modification time of the workunit rows seen by poll(), only
+        # rows modified since are fetched. None = fetch all.
+        self.last_mod_time = None
+
+        # all of the tracked workunits are fetched again every
+        # BOINC_FULL_POLL_INTERVAL seconds: mod_time is set when a statement
+        # runs, so a transaction that commits late can leave a row with a
+        # mod_time older than the latest one already seen
+        if keywords.get('BOINC_FULL_POLL_INTERVAL') is None:
+            self.full_poll_interval = 300.0
+        else:
+            self.full_poll_interval = float(keywords.get('BOINC_FULL_POLL_INTERVAL'))
+        self.last_full_poll = None
+
+        # seconds to wait after a workunit is assimilated for its output
+        # files to settle before considering it done, and the time at which
+        # assimilated workunits can be considered done
+        if keywords.get('BOINC_ASSIMILATE_SETTLE') is None:
+            self.assimilate_settle = 3.0
+        else:
+            self.assimilate_settle = float(keywords.get('BOINC_ASSIMILATE_SETTLE'))
+        self.settling = dict()
+
+        # optional script creating the workunits of a batch of replicas in
+        # one invocation, see _createWorkunits()
+        self.batch_executable = None
+        if keywords.get('BOINC_BATCH_EXECUTABLE') is not None:
+            self.batch_executable = os.path.abspath(keywords.get('BOINC_BATCH_EXECUTABLE'))
 
         # stage files
         if files_to_stage is not None:
@@ -74,6 +104,8 @@ class boinc_transport(Transport):
             f.close()
         except:
             None
+        # the status of all workunits needs to be fetched again
+        self.last_mod_time = None
 
     def save_restart(self):
         #write to saved file
@@ -98,13 +130,50 @@ class boinc_transport(Transport):
         """
 Enqueues a job based on provided job info.
         """
+        return self.launchJobs([(replica, job_info)])[0]
+
+    def launchJobs(self, batch):
+        """
+Creates the workunits of a batch of jobs, a list of (replica, job_info)
+pairs. With BOINC_BATCH_EXECUTABLE they are created by a single invocation
+of it, otherwise one at a time. The restart file is written once per batch.
+        """
+        for replica, job_info in batch:
+            if self.replica_to_wuid[replica] != None:
+                # a wuid for this replica already exists
+                # try to reset it through isDone() ...
+                self.isDone(replica, job_info["cycle"])
+
+        if self.batch_executable:
+            wuids = self._createWorkunits(batch)
+        else:
+            wuids = [self._createWorkunit(replica, job_info) for (replica, job_info) in batch]
+
+        handles = []
+        for (replica, job_info), wuid in zip(batch, wuids):
+            if wuid == None:
+                self.logger.warning("launchjob(): unable to create workunit for replica %d", replica)
+                handles.append(None)
+                continue
+
+            old_wuid = self.replica_to_wuid[replica]
+            if old_wuid:
+                self.logger.info("No longer tracking wuid: %s", old_wuid)
+                self.replica_status.pop(old_wuid)
+                self.settling.pop(old_wuid, None)
+
+            self.replica_to_wuid[replica] = wuid
+            self.replica_status[wuid] = False
+            self.logger.info("Now tracking wuid: %s", wuid)
+            handles.append(1)
+
+        #write status file
+        self.save_restart()
 
-        if self.replica_to_wuid[replica] != None:
-           # a wuid for this replica already exists
-           # try to reset it through isDone() ...
-           cycle = job_info["cycle"]
-           self.isDone(replica,cycle)
+        return handles
 
+    def _createWorkunit(self, replica, job_info):
+        # creates the workunit of a job, returns its id or None
         input_file = job_info["input_file"]
         executable = job_info["executable"]
         cycle = job_info["cycle"]
@@ -116,24 +185,96 @@ Enqueues a job based on provided job info.
         (out, err) = proc.communicate()
         # out should have the workunit name
         try:
-            wuid = int(out.split()[0])
+            return int(out.split()[0])
         except:
-            self.logger.warning("launchjob(): unable to create workunit")
             return None
 
-        old_wuid = self.replica_to_wuid[replica]
-        if old_wuid:
-            self.logger.info("No longer tracking wuid: %s", old_wuid)
-            self.replica_status.pop(old_wuid)
+    def _createWorkunits(self, batch):
+        """
+Creates the workunits of a batch of jobs with BOINC_BATCH_EXECUTABLE. It is
+run in the project directory with the job name as argument and receives on
+stdin one line per job:
 
-        self.replica_to_wuid[replica] = wuid
-        self.replica_status[wuid] = False
-        self.logger.info("Now tracking wuid: %s", wuid)
+   working_directory replica cycle
 
-        #write status file
-        self.save_restart()
+It writes on stdout one line per workunit created:
+
+   replica workunit
 
-        return 1
+where workunit is either the id or the name of the workunit; names are
+resolved into ids with a single database query. Returns the list of
+workunit ids in batch order, None for jobs without a workunit.
+        """
+        command = "cd %s ; %s %s" % (self.project_dir, self.batch_executable, self.jobname)
+        self.logger.info("%s (%d jobs)", command, len(batch))
+        lines = ["%s %s %s\n" % (job_info["working_directory"], replica, job_info["cycle"])
+                 for (replica, job_info) in batch]
+        proc = subprocess.Popen(command, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                stderr=subprocess.PIPE, shell=True)
+        (out, err) = proc.communicate("".join(lines))
+        if proc.returncode != 0:
+            self.logger.warning("_createWorkunits(): %s exited with status %d: %s",
+                                self.batch_executable, proc.returncode, err.strip())
+
+        created = dict()
+        names = dict()
+        for line in out.splitlines():
+            words = line.split()
+            if len(words) != 2:
+                continue
+            try:
+                replica = int(words[0])
+            except ValueError:
+                continue
+            try:
+                created[replica] = int(words[1])
+            except ValueError:
+                names[words[1]] = replica
+
+        if names:
+            sql_command = "SELECT id, name FROM workunit WHERE name IN (%s)"
+            sql_command = sql_command % ','.join([self.db.placeholder]*len(names))
+            for wuid, name in self._query(sql_command, names.keys()):
+                created[names[name]] = wuid
+
+        return [created.get(replica) for (replica, job_info) in batch]
+
+    def _connect(self, error_wait=10):
+        # opens the connection with the BOINC database, trying twice
+        try:
+            self.boinc_db = self.db.connect()
+        except self.db.OperationalError as e:
+            self.logger.warning("_connect(): Received operational error %s.", e)
+            self.logger.warning("_connect(): Trying one more time in %ds.", error_wait)
+            time.sleep(error_wait)
+            self.boinc_db = self.db.connect()
+
+        if not self.boinc_db:
+            self.logger.critical("_connect(): Unable to open connection with db %s", self.db_name)
+            sys.exit(1)
+
+    def _query(self, sql_command, args, error_wait=10):
+        # runs a query on the persistent connection, reconnecting once if the
+        # connection has been lost (server restart, wait_timeout, ...)
+        if self.boinc_db is None:
+            self._connect(error_wait)
+        try:
+            cur = self.boinc_db.cursor()
+            cur.execute(sql_command, args)
+        except self.db.OperationalError as e:
+            self.logger.warning("_query(): Received operational error %s, reconnecting", e)
+            try:
+                self.boinc_db.close()
+            except:
+                None
+            self._connect(error_wait)
+            cur = self.boinc_db.cursor()
+            cur.execute(sql_command, args)
+        result = cur.fetchall()
+        cur.close()
+        # ends the transaction so that the next query sees new changes
+        self.boinc_db.commit()
+        return result
 
     def poll(self, error_wait=10, timeout=86400):
         self.logger.info("Polling BOINC DB")
@@ -144,52 +285,55 @@ Enqueues a job based on provided job info.
             self.logger.info("Polling BOINC DB complete! Didn't find any wuids, though")
             return
 
-        try:
-            self.boinc_db = MySQLdb.connect(user=self.db_user, passwd=self.db_pwd,
-                                            db=self.db_name)
-        except operational_error as e:
-            self.logger.warning("poll(): Received operational error %d: %s.", e.errno, e.strerror)
-            self.logger.warning("poll(): Trying one more time in %ds.", error_wait)
-            time.sleep(error_wait)
-            self.boinc_db = MySQLdb.connect(user=self.db_user, passwd=self.db_pwd,
-                                            db=self.db_name)
-
-        if not self.boinc_db:
-            self.logger.critical("poll(): Unable to open connection with mysql db %s", self.db_name)
-            sys.exit(1)
-
-        cur = self.boinc_db.cursor()
-        sql_command = ("SELECT workunitid, server_state FROM result where "
-                       "result.workunitid IN (%s)")
-        sql_command = sql_command % ','.join(['%s']*len(wuids))
+        # workunits are done once assimilated, which updates their mod_time.
+        # The first poll, and then one every BOINC_FULL_POLL_INTERVAL
+        # seconds, fetch all of the tracked workunits; the others only the
+        # workunits modified since the latest modification seen, within the
+        # range of ids of the tracked workunits.
+        full = (self.last_mod_time is None or self.last_full_poll is None or
+                time.time() >= self.last_full_poll + self.full_poll_interval)
+        if full:
+            self.last_full_poll = time.time()
+            sql_command = ("SELECT id, assimilate_state, mod_time FROM workunit "
+                           "WHERE id IN (%s)")
+            sql_command = sql_command % ','.join([self.db.placeholder]*len(wuids))
+            args = list(wuid_strings)
+        else:
+            sql_command = ("SELECT id, assimilate_state, mod_time FROM workunit "
+                           "WHERE mod_time >= %s AND id BETWEEN %s AND %s")
+            sql_command = sql_command % ((self.db.placeholder,)*3)
+            args = [self.last_mod_time, min(wuids), max(wuids)]
 
-        cur.execute(sql_command, wuid_strings)
+        result = self._query(sql_command, args, error_wait)
 
         updated = set()
-        for wuid, status in cur.fetchall():
-            self.replica_status[wuid] = (status == 5)
+        now = time.time()
+        for wuid, assimilate_state, mod_time in result:
+            if mod_time is not None and (self.last_mod_time is None or mod_time > self.last_mod_time):
+                self.last_mod_time = mod_time
+            if wuid not in self.replica_status:
+                # not one of ours, or no longer tracked
+                continue
             updated.add(wuid)
-        cur.close()
-
-        for wuid in set(wuids) - updated:
-            self.logger.warning("poll(): cannot locate wu %s in db", str(wuid))
-            self.logger.warning("Assume it is not done and hope for the best")
+            if assimilate_state == 2:
+                if not self.replica_status.get(wuid) and wuid not in self.settling:
+                    self.settling[wuid] = now + self.assimilate_settle
+            else:
+                self.replica_status[wuid] = False
+                self.settling.pop(wuid, None)
 
-        #test for assimilation
-        cur = self.boinc_db.cursor()
-        sql_command = ("SELECT id, assimilate_state FROM workunit "
-                       "WHERE workunit.id IN (%s)")
-        sql_command = sql_command % ','.join(['%s']*len(wuids))
-        cur.execute(sql_command, wuid_strings)
-        result = cur.fetchall()
-        cur.close()
+        if full:
+            # all rows were requested
+            for wuid in set(wuids) - updated:
+                self.logger.warning("poll(): cannot locate wu %s in db", str(wuid))
+                self.logger.warning("Assume it is not done and hope for the best")
 
-        for wuid, assimilate_state in result:
-            if assimilate_state == 2:
-                time.sleep(3)
-            self.replica_status[wuid] = (assimilate_state == 2)
+        # assimilated workunits are done once their files have settled
+        for wuid, settle_time in self.settling.items():
+            if now >= settle_time:
+                self.replica_status[wuid] = True
+                self.settling.pop(wuid)
 
-        self.boinc_db.close()
         self.logger.info("Polling BOINC DB complete!")
 
         #2015/09/09 WFF
@@ -200,11 +344,12 @@ Enqueues a job based on provided job info.
             self.logger.warning("%s_boinc.stat has not been updated in more than a day", self.jobname)
             self.logger.warning("Is everything ok with the server and/or this job?")
 
-    def ProcessJobQueue(self, mintime, maxtime):
+    def _completedJobs(self):
         """
-with boinc there's no queue to process. Just wait until maxtime
+with boinc there's no queue to process. Workunits are complete once
+assimilated.
         """
-        time.sleep(maxtime)
+        return set(wuid for wuid, done in self.replica_status.iteritems() if done)
 
     def isDone(self,replica,cycle):
         """
@@ -219,6 +364,10 @@ with boinc there's no queue to process. Just wait until maxtime
             #checker discover if it needs to be resubmitted
             return True
         else:
+            if wuid in self.settling and time.time() >= self.settling[wuid]:
+                # assimilated and settled since the last poll
+                self.replica_status[wuid] = True
+                self.settling.pop(wuid)
             return self.replica_status[wuid]
 
 if __name__ == "__main__":
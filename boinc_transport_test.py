@@ -0,0 +1,189 @@
+"""
+Tests of the BOINC transport against a fake project directory and the
+SQLite stand-in of the BOINC database (see boinc_simulator.py).
+
+   python boinc_transport_test.py
+"""
+import os
+import sys
+import shutil
+import pickle
+import sqlite3
+import logging
+import tempfile
+import unittest
+
+package_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, package_dir)
+from boinc_transport import boinc_transport
+from boinc_simulator import init_project, boinc_simulator, latency
+
+# batch executable naming the workunits it reports, which the transport
+# resolves into ids
+batch_by_name = """#!/bin/sh
+while read working_directory replica cycle; do
+    echo $replica wu_$replica
+done
+"""
+
+
+class boinc_test_case(unittest.TestCase):
+
+    nreplicas = 4
+
+    def setUp(self):
+        logging.getLogger("async_re").setLevel(logging.WARNING)
+        self.cwd = os.getcwd()
+        self.directory = tempfile.mkdtemp()
+        os.chdir(self.directory)
+        self.project_dir = os.path.join(self.directory, "proj")
+        init_project(self.project_dir)
+        self.db = os.path.join(self.project_dir, "boinc.db")
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        shutil.rmtree(self.directory)
+
+    def _transport(self, batch_executable):
+        keywords = {'BOINC_PROJECTDIR': self.project_dir,
+                    'BOINC_DATABASE_BACKEND': 'sqlite',
+                    'BOINC_DATABASE': self.db,
+                    'BOINC_BATCH_EXECUTABLE': batch_executable}
+        transport = boinc_transport("job", keywords, self.nreplicas, None)
+        # counts the writes of the restart file
+        transport.nsaves = 0
+        save_restart = transport.save_restart
+        def counted_save_restart():
+            transport.nsaves += 1
+            save_restart()
+        transport.save_restart = counted_save_restart
+        return transport
+
+    def _batch(self, replicas, cycle=1):
+        return [(k, {'working_directory': os.path.join(self.directory, "r%d" % k),
+                     'cycle': cycle, 'input_file': "", 'executable': ""})
+                for k in replicas]
+
+    def _saved(self):
+        f = open("job_boinc.stat", "r")
+        replica_to_wuid = pickle.load(f)
+        f.close()
+        return replica_to_wuid
+
+
+class boinc_batch_test(boinc_test_case):
+
+    def test_batch_by_id(self):
+        transport = self._transport(os.path.join(self.project_dir, "bin", "create_work_batch"))
+        handles = transport.launchJobs(self._batch([0, 2, 3]))
+        self.assertEqual(handles, [1, 1, 1])
+        self.assertEqual(transport.nsaves, 1)
+
+        conn = sqlite3.connect(self.db)
+        rows = conn.execute("SELECT id, xml_doc FROM workunit").fetchall()
+        conn.close()
+        wuid = dict((working_directory, wuid) for (wuid, working_directory) in rows)
+        expected = [wuid[os.path.join(self.directory, "r0")], None,
+                    wuid[os.path.join(self.directory, "r2")],
+                    wuid[os.path.join(self.directory, "r3")]]
+        self.assertEqual(transport.replica_to_wuid, expected)
+        self.assertEqual(self._saved(), expected)
+        for k in (0, 2, 3):
+            self.assertFalse(transport.isDone(k, 1))
+        self.assertTrue(transport.isDone(1, 1))
+
+        # the next batch replaces the workunits of its replicas
+        transport.launchJobs(self._batch([0, 1], cycle=2))
+        self.assertEqual(transport.nsaves, 2)
+        self.assertEqual(len(set(transport.replica_to_wuid)), self.nreplicas)
+        self.assertEqual(sorted(transport.replica_status.keys()), sorted(transport.replica_to_wuid))
+        self.assertEqual(self._saved(), transport.replica_to_wuid)
+
+    def test_batch_by_name(self):
+        conn = sqlite3.connect(self.db)
+        for k in range(self.nreplicas):
+            conn.execute("INSERT INTO workunit (id, name, mod_time) VALUES (?, ?, 0)",
+                         (100 + k, "wu_%d" % k))
+        conn.commit()
+        conn.close()
+        batch_executable = os.path.join(self.directory, "batch_by_name")
+        f = open(batch_executable, "w")
+        f.write(batch_by_name)
+        f.close()
+        os.chmod(batch_executable, 0o755)
+
+        transport = self._transport(batch_executable)
+        transport.launchJobs(self._batch(range(self.nreplicas)))
+        self.assertEqual(transport.replica_to_wuid, [100, 101, 102, 103])
+        self.assertEqual(transport.nsaves, 1)
+        self.assertEqual(self._saved(), [100, 101, 102, 103])
+
+
+class boinc_poll_test(boinc_test_case):
+    """
+    Moves the workunits of a batch through their states with the simulator
+    and checks what poll() sees.
+    """
+
+    def _transport(self, batch_executable):
+        transport = boinc_test_case._transport(self, batch_executable)
+        transport.assimilate_settle = 0.0
+        # polls after the first one are incremental
+        transport.full_poll_interval = 1.0e9
+        return transport
+
+    def test_poll_assimilated(self):
+        transport = self._transport(os.path.join(self.project_dir, "bin", "create_work_batch"))
+        transport.launchJobs(self._batch(range(self.nreplicas)))
+        simulator = boinc_simulator(self.db, latency("fixed:0"), latency("fixed:0"), latency("fixed:0"))
+
+        transport.poll()
+        self.assertEqual(transport._completedJobs(), set())
+
+        # dispatched, then over: not done yet
+        self.assertEqual(simulator.step(), self.nreplicas)
+        self.assertEqual(simulator.step(), self.nreplicas)
+        transport.poll()
+        self.assertEqual(transport._completedJobs(), set())
+        for k in range(self.nreplicas):
+            self.assertFalse(transport.isDone(k, 1))
+
+        # assimilated, seen by an incremental poll
+        self.assertEqual(simulator.step(), self.nreplicas)
+        self.assertTrue(transport.last_mod_time is not None)
+        transport.poll()
+        self.assertEqual(transport._completedJobs(), set(transport.replica_to_wuid))
+        for k in range(self.nreplicas):
+            self.assertTrue(transport.isDone(k, 1))
+        self.assertEqual(simulator.step(), 0)
+
+    def test_late_commit(self):
+        transport = self._transport(os.path.join(self.project_dir, "bin", "create_work_batch"))
+        transport.launchJobs(self._batch(range(self.nreplicas)))
+        transport.poll()
+        watermark = transport.last_mod_time
+
+        # a workunit assimilated by a transaction that committed late, after
+        # a later modification of another workunit was seen
+        late = transport.replica_to_wuid[1]
+        conn = sqlite3.connect(self.db)
+        conn.execute("UPDATE workunit SET mod_time = ? WHERE id = ?",
+                     (watermark + 10.0, transport.replica_to_wuid[0]))
+        conn.commit()
+        transport.poll()
+        conn.execute("UPDATE workunit SET assimilate_state = 2, mod_time = ? WHERE id = ?",
+                     (watermark + 5.0, late))
+        conn.commit()
+        conn.close()
+
+        # missed by incremental polls, found by the next full poll
+        transport.poll()
+        self.assertFalse(transport.isDone(1, 1))
+        transport.full_poll_interval = 0.0
+        transport.poll()
+        self.assertTrue(transport.isDone(1, 1))
+        self.assertEqual(transport._completedJobs(), set([late]))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,199 @@
+"""
+Tests of the Condor transport against a canned user log and canned
+condor_submit output. condor_submit and condor_rm are replaced by scripts
+on the PATH.
+
+   python condor_log_test.py
+"""
+import os
+import sys
+import shutil
+import logging
+import tempfile
+import unittest
+
+package_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, package_dir)
+from condor_transport import condor_transport, condor_log_reader
+
+submitted = """000 (123.000.000) 10/18 12:00:00 Job submitted from host: <10.0.0.1:9618>
+...
+000 (123.001.000) 10/18 12:00:00 Job submitted from host: <10.0.0.1:9618>
+...
+001 (123.000.000) 10/18 12:00:05 Job executing on host: <10.0.0.2:9618>
+...
+"""
+
+terminated = """005 (123.000.000) 10/18 12:01:00 Job terminated.
+	(1) Normal termination (return value 0)
+		Usr 0 00:00:50, Sys 0 00:00:01  -  Run Remote Usage
+...
+"""
+
+held = """012 (123.001.000) 10/18 12:01:30 Job was held.
+	Error from slot1@node2: Failed to transfer files
+	Code 12 Subcode 2
+...
+"""
+
+aborted = """009 (123.001.000) 10/18 12:01:35 Job was aborted.
+	via condor_rm (by user re)
+...
+"""
+
+# fake condor_submit reporting the number of procs in the submit file
+condor_submit = """#!/bin/sh
+n=`sed -n '/^Queue/,/^)/p' $1 | grep -vc -e '^Queue' -e '^)'`
+echo "Submitting job(s)..."
+echo "$n job(s) submitted to cluster ${CLUSTER:-123}."
+"""
+
+# fake condor_rm recording its arguments
+condor_rm = """#!/bin/sh
+echo "$@" >> condor_rm.args
+"""
+
+
+class condor_test_case(unittest.TestCase):
+
+    def setUp(self):
+        logging.getLogger("async_re").setLevel(logging.WARNING)
+        self.cwd = os.getcwd()
+        self.path = os.environ.get('PATH', '')
+        self.directory = tempfile.mkdtemp()
+        os.chdir(self.directory)
+        bin_dir = os.path.join(self.directory, "bin")
+        os.mkdir(bin_dir)
+        for name, script in (("condor_submit", condor_submit), ("condor_rm", condor_rm)):
+            filename = os.path.join(bin_dir, name)
+            f = open(filename, "w")
+            f.write(script)
+            f.close()
+            os.chmod(filename, 0o755)
+        os.environ['PATH'] = bin_dir + os.pathsep + self.path
+        os.environ.setdefault('USER', 're')
+        self.log_file = os.path.join(self.directory, "condor.log")
+
+    def tearDown(self):
+        os.environ['PATH'] = self.path
+        os.environ.pop('CLUSTER', None)
+        os.chdir(self.cwd)
+        shutil.rmtree(self.directory)
+
+    def _log(self, text):
+        f = open(self.log_file, "a")
+        f.write(text)
+        f.close()
+
+    def _batch(self, replicas, cycle=1):
+        return [(k, {'working_directory': os.path.join(self.directory, "r%d" % k),
+                     'executable': "../runopenmm", 'input_file': "job_%d.py" % cycle,
+                     'cycle': cycle, 'job_input_files': ["job_%d.py" % cycle, "job.pdb"]})
+                for k in replicas]
+
+
+class condor_log_reader_test(condor_test_case):
+
+    def test_incremental(self):
+        reader = condor_log_reader(self.log_file)
+        self.assertEqual(reader.read(), [])
+
+        self._log(submitted)
+        self.assertEqual([(code, jobid) for code, jobid, text in reader.read()],
+                         [(0, "123.0"), (0, "123.1"), (1, "123.0")])
+        self.assertEqual(reader.offset, len(submitted))
+        self.assertEqual(reader.read(), [])
+
+        # an event still being written is left for the next read
+        self._log(terminated[:40])
+        self.assertEqual(reader.read(), [])
+        self.assertEqual(reader.offset, len(submitted))
+        self._log(terminated[40:] + held)
+        events = reader.read()
+        self.assertEqual([(code, jobid) for code, jobid, text in events],
+                         [(5, "123.0"), (12, "123.1")])
+        self.assertTrue("Normal termination" in events[0][2])
+        self.assertEqual(reader.offset, len(submitted + terminated + held))
+
+    def test_truncated(self):
+        reader = condor_log_reader(self.log_file)
+        self._log(submitted + terminated)
+        reader.read()
+
+        # a new, shorter log is read from its start
+        os.remove(self.log_file)
+        self._log(aborted)
+        self.assertEqual([(code, jobid) for code, jobid, text in reader.read()],
+                         [(9, "123.1")])
+        self.assertEqual(reader.offset, len(aborted))
+
+
+class condor_transport_test(condor_test_case):
+
+    def test_launch(self):
+        transport = condor_transport("job", 4)
+        handles = transport.launchJobs(self._batch([1, 3, 0]))
+        self.assertEqual(handles, [1, 1, 1])
+        # procs are numbered in batch order
+        self.assertEqual(transport.replica_to_jobid, ["123.2", "123.0", None, "123.1"])
+        self.assertFalse(transport.isDone(1, 1))
+        self.assertTrue(transport.isDone(2, 1))
+
+        f = open("job_submit")
+        submit = f.read()
+        f.close()
+        self.assertTrue("Log                     = %s\n" % self.log_file in submit)
+        self.assertTrue("%s, %s, job_1.py, 1, job_1.py,job.pdb\n" %
+                        (os.path.join(self.directory, "r3"),
+                         os.path.join(self.directory, "runopenmm")) in submit)
+
+        # the next cluster replaces the jobs of its replicas
+        os.environ['CLUSTER'] = '124'
+        transport.launchJobs(self._batch([0], cycle=2))
+        self.assertEqual(transport.replica_to_jobid, ["124.0", "123.0", None, "123.1"])
+        self.assertEqual(sorted(transport.replica_status.keys()), ["123.0", "123.1", "124.0"])
+
+        restarted = condor_transport("job", 4)
+        restarted.restart()
+        self.assertEqual(restarted.replica_to_jobid, transport.replica_to_jobid)
+
+    def test_launch_failure(self):
+        transport = condor_transport("job", 2)
+        os.remove(os.path.join(self.directory, "bin", "condor_submit"))
+        self.assertEqual(transport.launchJobs(self._batch([0, 1])), [None, None])
+        self.assertEqual(transport.replica_to_jobid, [None, None])
+
+    def test_poll(self):
+        transport = condor_transport("job", 3)
+        transport.launchJobs(self._batch([0, 1]))
+        self.assertEqual(transport.replica_to_jobid, ["123.0", "123.1", None])
+
+        self._log(submitted)
+        transport.poll()
+        self.assertEqual(transport._completedJobs(), set())
+
+        # a held job is removed from the queue but is not done until its
+        # abort event is logged; events of untracked jobs are ignored
+        self._log(terminated + held + terminated.replace("123.000", "99.000"))
+        transport.poll()
+        self.assertTrue(transport.isDone(0, 1))
+        self.assertFalse(transport.isDone(1, 1))
+        f = open("condor_rm.args")
+        self.assertEqual(f.read(), "123.1\n")
+        f.close()
+
+        self._log(aborted)
+        transport.poll()
+        self.assertTrue(transport.isDone(1, 1))
+        self.assertEqual(transport._completedJobs(), set(["123.0", "123.1"]))
+
+        # a restart rebuilds the status of the jobs from the whole log
+        restarted = condor_transport("job", 3)
+        restarted.restart()
+        self.assertEqual(restarted._completedJobs(), set())
+        restarted.poll()
+        self.assertEqual(restarted._completedJobs(), set(["123.0", "123.1"]))
+
+
+if __name__ == '__main__':
+    unittest.main()
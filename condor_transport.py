@@ -1,10 +1,58 @@
 import os
+import re
 import logging
 import subprocess
 import pickle
-import time
 from transport import Transport
 
+# user log event codes
+JOB_TERMINATED = 5
+JOB_ABORTED = 9
+JOB_HELD = 12
+
+
+class condor_log_reader(object):
+    """
+    Incremental reader of a Condor user (job event) log.
+
+    Each call to read() parses only the events appended to the log since the
+    previous call, starting from the byte offset where it stopped. An event
+    still being written, without its closing '...' line, is left for the
+    next call.
+    """
+    header = re.compile(r'(\d{3}) \((\d+)\.(\d+)\.\d+\)')
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.offset = 0
+
+    def read(self):
+        """
+        Returns the list of (event code, cluster.proc job id, event text) of
+        the events appended to the log since the last call.
+        """
+        if not os.path.exists(self.filename):
+            return []
+        if os.path.getsize(self.filename) < self.offset:
+            # the log has been truncated or replaced
+            self.offset = 0
+        f = open(self.filename, 'r')
+        f.seek(self.offset)
+        data = f.read()
+        f.close()
+        end = data.rfind('...\n')
+        if end < 0:
+            return []
+        data = data[:end + 4]
+        self.offset += len(data)
+        events = []
+        for text in data.split('...\n'):
+            m = self.header.search(text)
+            if m:
+                jobid = "%d.%d" % (int(m.group(2)), int(m.group(3)))
+                events.append((int(m.group(1)), jobid, text))
+        return events
+
 
 class condor_transport(Transport):
     """
@@ -22,21 +70,31 @@ class condor_transport(Transport):
 
         self.replica_status = dict()
 
-        """ Template for Condor submit description file """
+        # all jobs log their events to a single user log in the job
+        # directory, read incrementally by poll()
+        self.log_file = os.getcwd() + "/condor.log"
+        self.log_reader = condor_log_reader(self.log_file)
+
+        """ Template for Condor submit description file, one proc per replica of a batch """
         self.condor_submit_file = """+ProjectName = "TG-MCB150001"
 Universe                = vanilla
-Executable              = {executable}
+Executable              = $(job_executable)
 request_cpus            = 1
 Requirements            = OpSys == "LINUX" && Arch == "X86_64" && (RequestCpus <= Target.Cpus)
-Arguments               = {input_file}
+Arguments               = $(job_input)
 should_transfer_files   = YES
-transfer_input_files    = {job_input_files}
-Log                     = condor.log
-Output                  = {jobname}_{cycle}.log
-Error                   = {jobname}_{cycle}.error
-Queue
+transfer_input_files    = $(job_input_files)
+Initialdir              = $(job_directory)
+Log                     = {log_file}
+Output                  = {jobname}_$(job_cycle).log
+Error                   = {jobname}_$(job_cycle).error
+Queue job_directory, job_executable, job_input, job_cycle, job_input_files from (
+{items}
+)
 
 """
+        # cluster id reported by condor_submit
+        self.submitted = re.compile(r'(\d+) job\(s\) submitted to cluster (\d+)')
 
     def restart(self):
         # read replica job id from a saved stat file
@@ -46,8 +104,7 @@ Queue
             with open(status_file, 'rb') as f:
                 # unpickle the list
                 self.replica_to_jobid = pickle.load(f)
-                print "Unpickling the list of jobids"
-                print self.replica_to_jobid
+                self.logger.info("Tracking jobids %s", self.replica_to_jobid)
                 for jobid in self.replica_to_jobid:
                     if not jobid:
                         continue
@@ -55,6 +112,8 @@ Queue
 
         except:
             None
+        # the status of the jobs is rebuilt from all of the events in the log
+        self.log_reader.offset = 0
 
     def save_restart(self):
         # write new job id for replicas to the saved file
@@ -67,111 +126,105 @@ Queue
             None
 
     def launchJob(self, replica, job_info):
+        """
+        Submits a job based on provided job info.
+        """
+        return self.launchJobs([(replica, job_info)])[0]
 
-        input_file = job_info["input_file"]
-        executable = job_info["executable"]
-        job_input_files = job_info["job_input_files"]
-
-        # convert list of job input files to a string
-        string_input_files = ','.join(str(f) for f in job_input_files)
-
-        cycle = job_info["cycle"]
-        working_directory = job_info["working_directory"]
-
-        condor_submit_file = self.jobname + '_' + str(cycle) + '_submit'
-
-
-        input = self.condor_submit_file.format(
-            executable=executable, input_file=input_file,
-            job_input_files=string_input_files, cycle=str(cycle),
-            jobname=self.jobname)
-
-        with open(working_directory + '/' + condor_submit_file, 'w') as submit_file:
+    def launchJobs(self, batch):
+        """
+        Submits a batch of jobs, a list of (replica, job_info) pairs, as the
+        procs of a single cluster with one condor_submit. The proc number of
+        each job is its position in the batch.
+        """
+        items = []
+        for replica, job_info in batch:
+            working_directory = job_info["working_directory"]
+            executable = job_info["executable"]
+            if not os.path.isabs(executable):
+                executable = os.path.normpath(os.path.join(working_directory, executable))
+            # convert list of job input files to a string; as the last
+            # item variable it can contain commas
+            string_input_files = ','.join(str(f) for f in job_info["job_input_files"])
+            items.append("%s, %s, %s, %s, %s" % (working_directory, executable, job_info["input_file"],
+                                                 job_info["cycle"], string_input_files))
+
+        input = self.condor_submit_file.format(items='\n'.join(items), jobname=self.jobname,
+                                               log_file=self.log_file)
+
+        condor_submit_file = self.jobname + '_submit'
+        with open(condor_submit_file, 'w') as submit_file:
             submit_file.write(input)
 
-        launch_command = " cd %s ; condor_submit %s" % (working_directory, condor_submit_file)
+        launch_command = "condor_submit %s" % condor_submit_file
 
-        self.logger.info(launch_command)
+        self.logger.info("%s (%d jobs)", launch_command, len(batch))
         launch_job = subprocess.Popen(launch_command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, shell=True)
 
         (out, err) = launch_job.communicate()
 
-        try:
-            # print 'printing job id : %s' % out
-            jobid = out.split()[-1] + '0'
-            print 'job id is printed as : %s' % jobid
-        except:
-            self.logger.warning("launchJob():Unable to retrieve JobID")
-            return None
+        m = self.submitted.search(out)
+        if not m or int(m.group(1)) != len(batch):
+            self.logger.warning("launchJobs():Unable to retrieve JobIDs: %s %s", out.strip(), err.strip())
+            return [None for job in batch]
+        cluster = m.group(2)
+
+        handles = []
+        for proc, (replica, job_info) in enumerate(batch):
+            jobid = "%s.%d" % (cluster, proc)
 
-        old_jobid = self.replica_to_jobid[replica]
-        if old_jobid:
-            self.logger.info("No longer tracking jobId : %s" % old_jobid)
-            self.replica_status.pop(old_jobid)
+            old_jobid = self.replica_to_jobid[replica]
+            if old_jobid:
+                self.logger.info("No longer tracking jobId : %s" % old_jobid)
+                self.replica_status.pop(old_jobid)
 
-        self.replica_to_jobid[replica] = jobid
-        self.replica_status[jobid] = False
-        self.logger.info("Now tracking jobId : %s " % jobid)
+            self.replica_to_jobid[replica] = jobid
+            self.replica_status[jobid] = False
+            self.logger.info("Now tracking jobId : %s " % jobid)
+            handles.append(1)
 
-        # write the status file with updated jobID
+        # write the status file with updated jobIDs
         self.save_restart()
 
-        return 1
+        return handles
 
     def poll(self, error_wait=10, timeout=86400):
-
-        self.logger.info("Checking from Condor queue")
-
-        initial_jobids = self.replica_status.keys()
-        # convert to a set
-        set_initial_jobids = set(initial_jobids)
-        
-        if not initial_jobids:
-            self.logger.info("Cannot find any old job ids")
-            return
-        # Add in git commit : removed the query for submitter name from condor_q
-        # in OSG, no need to escape the format specifier in the condor_q command
-        query_queue = "condor_q -format \"%d.\" ClusterId -format \"%d\n\" ProcId"
-        # for local, query_queue = "condor_q -format \"%%d.\" ClusterId -format \"%%d\n\" ProcId"
-        self.logger.info(query_queue)
-        run_condor_q = subprocess.Popen(query_queue, stdout=subprocess.PIPE, stderr=subprocess.PIPE, shell=True)
-
-        (out, err) = run_condor_q.communicate()
-        id_list = out.split()
-        print "list of ids from condor_q:"
-        print id_list
-
-        condor_job_ids = set(id_list)
-        
-        # print condor_job_ids
-
-        # gets a set of job ids which are not retrieved by Condor and the jobs are assumed to be done.
-        # A replica which has never run is assigned a job id None. The following conditional statement and the isDone()
-        # method will return that replica as True. Further checking may be needed to streamline the code for suspected
-        # bugs
-
-        done_set = set_initial_jobids - condor_job_ids
-        print "jobs which are done are:\n"
-        
-        print done_set
-
-        for id in done_set:
-            self.replica_status[id] = True
-        print "replicas with status:\n"
-        print self.replica_status
-
-        self.logger.info("Polling Condor queue is complete")
-
-    def ProcessJobQueue(self, mintime, maxtime):
         """
-        Just wait until maxtime for Condor to complete the job
+        Updates the status of the tracked jobs from the events appended to
+        the user log since the last poll. Terminated and aborted jobs are
+        done; held jobs are removed from the queue so that their replicas
+        are resubmitted once their abort event is logged.
+        """
+        held = []
+        for code, jobid, text in self.log_reader.read():
+            if jobid not in self.replica_status:
+                continue
+            if code == JOB_TERMINATED:
+                self.replica_status[jobid] = True
+            elif code == JOB_ABORTED:
+                self.logger.warning("poll(): job %s was aborted", jobid)
+                self.replica_status[jobid] = True
+            elif code == JOB_HELD:
+                reason = text.split('\n')[1].strip() if '\n' in text else ''
+                self.logger.warning("poll(): job %s is held: %s", jobid, reason)
+                held.append(jobid)
+
+        if held:
+            remove_command = "condor_rm %s" % ' '.join(held)
+            self.logger.info(remove_command)
+            remove_jobs = subprocess.Popen(remove_command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, shell=True)
+            remove_jobs.communicate()
+
+    def _completedJobs(self):
+        """
+        Condor jobs which have left the queue are complete
         """
-        time.sleep(maxtime)
+        return set(jobid for jobid, done in self.replica_status.iteritems() if done)
 
     def isDone(self, replica, cycle):
         """
-        Checks if a replica has completed a run. Replica which has never run anytime is also returned as True as
-        isDone() looks at the condor_q output query and considers the job complete if condor_q does not return a JobId
+        Checks if a replica has completed a run. Replica which has never run anytime is also returned as True.
+        The job of a replica is complete once its terminate or abort event is found in the user log by poll()
         """
         jobid = self.replica_to_jobid[replica]
 
@@ -1,5 +1,6 @@
 import os, sys, time
 from async_re import async_re
+from gibbs_sampling import compact_swap_matrix
 
 """
 Adapted from:
@@ -8,9 +9,9 @@ https://github.com/saga-project/asyncre-bigjob
 
 class date_job(async_re):
 
-    def _launchReplica(self,replica,cycle):
+    def _buildJobInfo(self,replica,cycle):
         """
-        Issues a command to launch /bin/date
+        Returns the job info of a /bin/date sub-job
         """
         job_info = {
             "executable": "dodate",
@@ -18,14 +19,13 @@ class date_job(async_re):
             "output_file": "sj-stdout-"+str(replica)+"-"+str(cycle)+".txt",
             "error_file": "sj-stderr-"+str(replica)+"-"+str(cycle)+".txt",
             "working_directory":os.getcwd()+"/r"+str(replica),
+            "cycle": cycle,
         }
 
         if self.keywords.get('VERBOSE') == "yes":
             print "Launching %s in directory %s cycle %d" % ("/bin/date",os.getcwd()+"/r"+str(replica),cycle)
 
-        status = self.transport.launchJob(replica, job_info)
-
-        return status
+        return job_info
 
 
 class date_async_re_job(date_job,async_re):
@@ -50,8 +50,7 @@ class date_async_re_job(date_job,async_re):
         pass
 
     def _computeSwapMatrix(self, replicas, states):
-        U = [[ 0. for j in range(self.nreplicas)]
-             for i in range(self.nreplicas)]
+        U = compact_swap_matrix(replicas, states)
         return U
 
 if __name__ == '__main__':
@@ -1,5 +1,6 @@
 """Gibbs sampling routines"""
-from numpy import zeros, exp, sum, log, asarray
+import sys
+from numpy import zeros, exp, sum, log, asarray, clip, cumsum, searchsorted
 from numpy.random import random as _random
 from random import choice
 from itertools import permutations
@@ -11,15 +12,36 @@ def _exit(message):
     print 'exiting...'
     sys.exit(1)
 
-def weighted_choice(choices):
-    """Return a discrete outcome given a set of outcome/weight pairs."""
-    r = _random()*sum(w for c,w in choices)
-    for c,w in choices:
-        r -= w
-        if r < 0:
-            return c
-    # You should never get here.
-    return None
+class compact_swap_matrix(object):
+    """
+    Swap matrix restricted to a subset of replicas and of states, typically
+    the replicas in a wait state and the states they occupy.
+
+    The energies are stored in a dense numpy array, u[a,i] being the energy of
+    replica replicas[i] in state states[a]. replica_index and state_index map
+    replica and state ids to column and row indices of u.
+    """
+    def __init__(self, replicas, states):
+        self.replicas = list(replicas)
+        self.states = list(states)
+        self.replica_index = dict(zip(self.replicas, range(len(self.replicas))))
+        self.state_index = dict(zip(self.states, range(len(self.states))))
+        self.u = zeros((len(self.states), len(self.replicas)))
+
+def _swap_matrix_arrays(U, replicas, states):
+    """
+    Return the energies of swap matrix U as a numpy array u, along with the
+    row indices of the given states and the column indices of the given
+    replicas in u, so that u[rows[a],cols[i]] = U[states[a]][replicas[i]].
+
+    U is either a compact_swap_matrix or a full matrix indexed by state and
+    replica ids.
+    """
+    if isinstance(U, compact_swap_matrix):
+        rows = asarray([U.state_index[sid] for sid in states])
+        cols = asarray([U.replica_index[repl] for repl in replicas])
+        return (U.u, rows, cols)
+    return (asarray(U), asarray(states), asarray(replicas))
 
 def pairwise_metropolis_sampling(repl_i, sid_i, replicas, states, U):
     """
@@ -46,8 +68,9 @@ def pairwise_metropolis_sampling(repl_i, sid_i, replicas, states, U):
     # Apply the Metropolis acceptance criteria. If the move is accepted, return
     # this replica, otherwise return the same replica (no exchange).
     #
-    du = (U[sid_i][repl_j] + U[sid_j][repl_i]
-          - U[sid_i][repl_i] - U[sid_j][repl_j])
+    u, rows, cols = _swap_matrix_arrays(U, [repl_i, repl_j], [sid_i, sid_j])
+    du = (u[rows[0],cols[1]] + u[rows[1],cols[0]]
+          - u[rows[0],cols[0]] - u[rows[1],cols[1]])
     if du > 0.:
         if _random() > exp(-du):
             return repl_i
@@ -78,41 +101,36 @@ def pairwise_independence_sampling(repl_i, sid_i, replicas, states, U):
     the states they occupy in r and b and a, respectively, those in s.
 
     The energies u_a(i), i=1,n and a=1,n, are assumed stored in the input 
-    "swap matrix," U[a][i].
+    "swap matrix," U[a][i], or in a compact_swap_matrix.
 
     In general, the set of replicas across which exchanges are considered is a 
     subset of the n replicas. This list is passed in the 'replicas' list. 
     Replica "i" ('repl_i') is assumed to be in this list.
+
+    The swap matrix is indexed with numpy arrays, so that a full U is best
+    passed as a numpy array rather than as a list of lists.
     """
-    # Evaluate all i-j swap probabilities.
-    #
     nreplicas = len(replicas)
-    ps = zeros(nreplicas) # probability of swap i <-> j
-    du = zeros(nreplicas) # Boltzmann exponent, ps ~ exp(-du)
-    for j,repl_j,sid_j in zip(range(nreplicas),replicas,states):
-        du[j] = (U[sid_i][repl_j] + U[sid_j][repl_i] 
-                 - U[sid_i][repl_i] - U[sid_j][repl_j])
-    eu = exp(-du)
-    
-    pii = 1.0
-    i = -1
-    f = 1./(float(nreplicas) - 1.)
-    for j in range(nreplicas):
-        repl_j = replicas[j]
-        if repl_j == repl_i:
-            i = j
-        else:
-            if eu[j] > 1.0:
-                ps[j] = f
-            else:                    
-                ps[j] = f*eu[j]
-            pii -= ps[j]
     try:
-        ps[i] = pii
-    except IndexError:
+        i = replicas.index(repl_i)
+    except ValueError:
         _exit('gibbs_re_j(): unrecoverable error: replica %d not in the '
-              'list of waiting replicas?'%i)
-    return replicas[weighted_choice(zip(range(nreplicas),ps))]
+              'list of waiting replicas?'%repl_i)
+    u, sids, repls = _swap_matrix_arrays(U, replicas, states)
+    sid_i = _swap_matrix_arrays(U, [repl_i], [sid_i])[1][0]
+    repl_i = repls[i]
+    # Evaluate all i-j swap probabilities.
+    #
+    # Boltzmann exponent, ps ~ exp(-du)
+    du = (u[sid_i,repls] + u[sids,repl_i] - u[sid_i,repl_i] - u[sids,repls])
+    # probability of swap i <-> j, min[1,exp(-du)]/(n-1)
+    ps = exp(-clip(du, 0., None))/(float(nreplicas) - 1.)
+    ps[i] = 0.
+    ps[i] = 1. - ps.sum()
+    # draw j from the cumulative distribution
+    cps = cumsum(ps)
+    j = searchsorted(cps, _random()*cps[-1], side='right')
+    return replicas[min(j, nreplicas - 1)]
 
 def state_perm_distribution(replicas, states, swap_matrix):
     """
@@ -130,7 +148,8 @@ def state_perm_distribution(replicas, states, swap_matrix):
     Z_s = 0.
     for state_perm in permutations(states):
         perm = str(zip(replicas,state_perm))
-        u_s = sum([swap_matrix[j][i] for i,j in zip(replicas,state_perm)])
+        u, rows, cols = _swap_matrix_arrays(swap_matrix, replicas, state_perm)
+        u_s = sum(u[rows,cols])
         exp_us = exp(-u_s)
         perm_dist[perm] = exp_us
         Z_s += exp_us
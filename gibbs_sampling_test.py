@@ -0,0 +1,99 @@
+"""
+Tests of the Gibbs sampling routines.
+
+   python gibbs_sampling_test.py
+"""
+import os
+import sys
+import unittest
+import numpy
+from numpy import zeros, exp
+
+package_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, package_dir)
+from gibbs_sampling import pairwise_independence_sampling, compact_swap_matrix
+
+
+def loop_independence_sampling(repl_i, sid_i, replicas, states, U):
+    """
+    The replica-by-replica implementation of pairwise_independence_sampling
+    that the vectorized one replaced, with its weighted_choice().
+    """
+    nreplicas = len(replicas)
+    ps = zeros(nreplicas)
+    du = zeros(nreplicas)
+    for j,repl_j,sid_j in zip(range(nreplicas),replicas,states):
+        du[j] = (U[sid_i][repl_j] + U[sid_j][repl_i]
+                 - U[sid_i][repl_i] - U[sid_j][repl_j])
+    eu = exp(-du)
+    pii = 1.0
+    i = -1
+    f = 1./(float(nreplicas) - 1.)
+    for j in range(nreplicas):
+        repl_j = replicas[j]
+        if repl_j == repl_i:
+            i = j
+        else:
+            if eu[j] > 1.0:
+                ps[j] = f
+            else:
+                ps[j] = f*eu[j]
+            pii -= ps[j]
+    ps[i] = pii
+    choices = zip(range(nreplicas),ps)
+    r = numpy.random.random()*sum(w for c,w in choices)
+    for c,w in choices:
+        r -= w
+        if r < 0:
+            return replicas[c]
+    return None
+
+
+class independence_sampling_test(unittest.TestCase):
+
+    nreplicas = 8
+    # the waiting replicas exchanging states
+    replicas = [0, 2, 3, 5, 6]
+    nrounds = 50
+
+    def _exchange(self, sampler, U, seed):
+        # exchange rounds as in async_re.doExchanges(), returns the states
+        # of the replicas
+        numpy.random.seed(seed)
+        stateid = dict(zip(self.replicas, self.states))
+        for round in range(self.nrounds):
+            for repl_i in self.replicas:
+                curr_states = [stateid[repl_j] for repl_j in self.replicas]
+                repl_j = sampler(repl_i, stateid[repl_i], self.replicas, curr_states, U)
+                if repl_j != repl_i:
+                    stateid[repl_i], stateid[repl_j] = stateid[repl_j], stateid[repl_i]
+        return [stateid[k] for k in self.replicas]
+
+    def setUp(self):
+        numpy.random.seed(1234)
+        # energies of all replicas in all states, on the scale of kT
+        self.u = 2.0*numpy.random.random((self.nreplicas, self.nreplicas))
+        self.states = [7, 1, 4, 0, 3]
+
+    def test_full_matrix(self):
+        for seed in range(10):
+            expected = self._exchange(loop_independence_sampling, self.u.tolist(), seed)
+            self.assertEqual(self._exchange(pairwise_independence_sampling, self.u, seed), expected)
+            self.assertEqual(sorted(expected), sorted(self.states))
+
+    def test_compact_matrix(self):
+        U = compact_swap_matrix(self.replicas, self.states)
+        for a, sid in enumerate(self.states):
+            for i, repl in enumerate(self.replicas):
+                U.u[a,i] = self.u[sid,repl]
+        for seed in range(10):
+            expected = self._exchange(loop_independence_sampling, self.u.tolist(), seed)
+            self.assertEqual(self._exchange(pairwise_independence_sampling, U, seed), expected)
+
+    def test_exchanges_happen(self):
+        # the permutation does change, so that the comparisons are not trivial
+        self.assertNotEqual(self._exchange(pairwise_independence_sampling, self.u, 0), self.states)
+
+
+if __name__ == '__main__':
+    unittest.main()
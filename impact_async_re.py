@@ -4,16 +4,26 @@ import random
 import math
 import logging
 from async_re import async_re
+from gibbs_sampling import compact_swap_matrix
 
 
 class impact_job(async_re):
 
+    # number of lines of numbers following each "Step number:" line of the
+    # Impact output file
+    _impact_data_lines = 3
+
+    def __init__(self, command_file, options):
+        # last record of the output file of each replica, see _getLastRecord()
+        self._last_record_cache = {}
+        async_re.__init__(self, command_file, options)
+
     def _setLogger(self):
         self.logger = logging.getLogger("async_re.impact_async_re")
 
-    def _launchReplica(self, replica, cycle):
+    def _buildJobInfo(self, replica, cycle):
         """
-        Launches a Impact sub-job
+        Returns the job info of an Impact sub-job for the job transport
         """
         input_file = "%s_%d.inp" % (self.basename, cycle)
         log_file = "%s_%d.log" % (self.basename, cycle)
@@ -34,8 +44,8 @@ class impact_job(async_re):
                 os.remove(failed_file)
 
         else:
-            # self.transport_mechanism == "SSH" or self.transport_mechanism == "CONDOR":
-            # if the transport mechanism is either SSH or CONDOR, follow this
+            # self.transport_mechanism == "SSH", "CONDOR", "LOCAL" or "PILOT":
+            # if the transport mechanism is either SSH, CONDOR, LOCAL or PILOT, follow this
             rstfile_p = "%s_%d.rst" % (self.basename, cycle - 1)
             local_working_directory = os.getcwd() + "/r" + str(replica)
             remote_replica_dir = "%s_r%d_c%d" % (self.basename, replica, cycle)
@@ -66,19 +76,27 @@ class impact_job(async_re):
             job_input_files = []
             job_input_files.append(input_file)
 
+            # restart files from the previous cycle
+            job_restart_files = []
             if rstfile_p:
-                job_input_files.append(rstfile_p)
+                job_restart_files.append(rstfile_p)
 
             if self.keywords.get('RE_TYPE') == 'BEDAMTEMPT':
                 dmsfile_rcpt_p = "%s_rcpt_%d.dms" % (self.basename, cycle - 1)
                 dmsfile_lig_p = "%s_lig_%d.dms" % (self.basename, cycle - 1)
-                job_input_files.append(dmsfile_rcpt_p)
-                job_input_files.append(dmsfile_lig_p)
+                job_restart_files.append(dmsfile_rcpt_p)
+                job_restart_files.append(dmsfile_lig_p)
             if self.keywords.get('RE_TYPE') == 'TEMPT':
                 dmsfile = "%s_%d.dms" % (self.basename, cycle - 1)
-                job_input_files.append(dmsfile)
+                job_restart_files.append(dmsfile)
+            for filename in job_restart_files:
+                job_input_files.append(filename)
 
-            for filename in self.extfiles:
+            # static input files, the same for all replicas and cycles
+            job_static_files = []
+            if self.extfiles:
+                job_static_files = list(self.extfiles)
+            for filename in job_static_files:
                 job_input_files.append(filename)
 
             job_output_files = []
@@ -93,28 +111,33 @@ class impact_job(async_re):
                 rcptfile = "%s_rcpt_%d.dms" % (self.basename, cycle)
                 ligfile = "%s_lig_%d.dms" % (self.basename, cycle)
             job_output_files.append(output_file)
-            job_output_files.append(rstfile)
+            # restart files for the next cycle
+            job_restart_outputs = []
+            job_restart_outputs.append(rstfile)
             if self.keywords.get('RE_TYPE') == 'TEMPT':
-                job_output_files.append(dmsfile)
+                job_restart_outputs.append(dmsfile)
             elif self.keywords.get('RE_TYPE') == 'BEDAMTEMPT':
-                job_output_files.append(rcptfile)
-                job_output_files.append(ligfile)
+                job_restart_outputs.append(rcptfile)
+                job_restart_outputs.append(ligfile)
+            for filename in job_restart_outputs:
+                job_output_files.append(filename)
 
             job_info["job_input_files"] = job_input_files
+            job_info["job_static_files"] = job_static_files
             job_info["job_output_files"] = job_output_files
+            job_info["job_restart_files"] = job_restart_files
+            job_info["job_restart_outputs"] = job_restart_outputs
 
 
         if self.keywords.get('VERBOSE') == "yes":
-            msg = "_launchReplica(): Launching %s %s in directory %s cycle %d"
+            msg = "_buildJobInfo(): Launching %s %s in directory %s cycle %d"
 
-            if self.transport_mechanism == 'SSH' or self.transport_mechanism == 'CONDOR':
+            if self.transport_mechanism != 'BOINC':
                 self.logger.info(msg, executable, input_file, local_working_directory, cycle)
             else:
                 self.logger.info(msg, executable, input_file, working_directory, cycle)
 
-        status = self.transport.launchJob(replica, job_info)
-
-        return status
+        return job_info
 
     def _getImpactData(self, file):
         """
@@ -139,10 +162,10 @@ class impact_job(async_re):
             if re.match(step_line, line):
                 words = line.split()
                 step = words[2]
-                # now read up to 3 lines of numbers
+                # now read up to _impact_data_lines lines of numbers
                 datablock = [int(step)]
                 ln = 0
-                while ln < 3:
+                while ln < self._impact_data_lines:
                     line = f.readline()
                     if not line:
                         msg = "Unexpected end of file"
@@ -156,6 +179,81 @@ class impact_job(async_re):
         f.close()
         return data
 
+    def _getImpactLastData(self, file, blocksize=8192):
+        """
+        Reads the Impact simulation data values of the last time step only.
+
+        Rather than parsing the whole file as _getImpactData() does, seeks
+        backwards from the end of the file to the last "Step number:" line and
+        decodes only that record. Returns None if there are no records.
+        """
+        if not os.path.exists(file):
+            msg = 'File does not exist: %s' % file
+            self._exit(msg)
+        step_line = " Step number:"
+        number_line = re.compile("(\s+-*\d\.\d+E[\+-]\d+\s*)+")
+        f = self._openfile(file, "r")
+        f.seek(0, 2)
+        end = f.tell()
+        start = end
+        offset = None
+        # scan backwards in blocks of increasing size
+        while start > 0 and offset is None:
+            start = max(0, start - blocksize)
+            f.seek(start)
+            buffer = f.read(end - start)
+            i = buffer.rfind("\n" + step_line)
+            if i >= 0:
+                offset = start + i + 1
+            elif start == 0 and buffer.startswith(step_line):
+                offset = 0
+            blocksize *= 2
+        if offset is None:
+            f.close()
+            return None
+        # read the step number
+        f.seek(offset)
+        words = f.readline().split()
+        datablock = [int(words[2])]
+        # now read up to _impact_data_lines lines of numbers
+        ln = 0
+        while ln < self._impact_data_lines:
+            line = f.readline()
+            if not line:
+                msg = "Unexpected end of file"
+                self._exit(msg)
+            if re.match(number_line, line):
+                for word in line.split():
+                    datablock.append(float(word))
+                ln += 1
+        f.close()
+        return datablock
+
+    def _getLastRecord(self, replica, cycle):
+        """
+        Returns the last record of the Impact output file of a replica for
+        the specified cycle.
+
+        Records are cached, one per replica, keyed by cycle, size and
+        modification time of the output file, so that the output file of a
+        replica is parsed once when _hasCompleted() validates it rather than
+        again at every exchange round while the replica waits. The entry of a
+        replica is replaced when it completes its next cycle.
+        """
+        output_file = "r%s/%s_%d.out" % (replica, self.basename, cycle)
+        if not os.path.exists(output_file):
+            msg = 'File does not exist: %s' % output_file
+            self._exit(msg)
+        st = os.stat(output_file)
+        key = (cycle, st.st_size, st.st_mtime)
+        entry = self._last_record_cache.get(replica)
+        if entry is not None and entry[0] == key:
+            return entry[1]
+        datai = self._getImpactLastData(output_file)
+        if datai is not None:
+            self._last_record_cache[replica] = (key, datai)
+        return datai
+
     def _hasCompleted(self, replica, cycle):
         """
         Returns true if an IMPACT replica has successfully completed a cycle.
@@ -192,10 +290,10 @@ class impact_job(async_re):
             return False
 
         try:
-            # check that we can read data from .out
-            datai = self._getImpactData(output_file)
-            nf = len(datai[0])
-            nr = len(datai)
+            # check that we can read data from .out, this also caches the
+            # energies of the last record for exchanges
+            datai = self._getLastRecord(replica, cycle)
+            nf = len(datai)
         except:
             if self.verbose:
                 self.logger.warning("Unable to read/parse file %s", output_file)
@@ -239,18 +337,13 @@ class impact_job(async_re):
     def _computeSwapMatrix(self, replicas, states):
         """
         Compute matrix of dimension-less energies: each column is a replica
-        and each row is a state so U[i][j] is the energy of replica j in state
-        i.
+        and each row is a state so U.u[j,i] is the energy of replica
+        replicas[i] in state states[j].
 
-        Note that the matrix is sized to include all of the replicas and states
-        but the energies of replicas not in waiting state, or those of waiting
-        replicas for states not belonging to waiting replicas list are
-        undefined.
+        The matrix is sized to include only the waiting replicas and the
+        states they occupy, see compact_swap_matrix.
         """
-        # U will be sparse matrix, but is convenient bc the indices of the
-        # rows and columns will always be the same.
-        U = [[0. for j in range(self.nreplicas)]
-             for i in range(self.nreplicas)]
+        U = compact_swap_matrix(replicas, states)
 
         n = len(replicas)
 
@@ -267,10 +360,28 @@ class impact_job(async_re):
             self.logger.info("%s", ' '.join(map(str, pot)))
             self.logger.info("%s", ' '.join(map(str, par)))
 
+        # energies of all replicas in all states at once if the adaptor
+        # implements _reduced_energy_block(), otherwise one pair at a time
+        u = self._reduced_energy_block(par, pot)
+        if u is not None:
+            U.u[:,:] = u
+            return U
         for i in range(n):
-            repl_i = replicas[i]
             for j in range(n):
-                sid_j = states[j]
                 # energy of replica i in state j
-                U[sid_j][repl_i] = self._reduced_energy(par[j], pot[i])
+                U.u[j,i] = self._reduced_energy(par[j], pot[i])
         return U
+
+    def _reduced_energy_block(self, par, pot):
+        """
+        Vectorized version of _reduced_energy(). par and pot are the lists
+        whose elements par[j] and pot[i] are the parameters of state j and
+        the potentials of replica i as returned by _getPar() and _getPot(),
+        typically converted with numpy.asarray() by the implementation.
+        Returns the array of dimension-less energies whose [j,i] element is
+        _reduced_energy(par[j], pot[i]).
+
+        Adaptors that do not implement it return None, and the swap matrix is
+        then computed one replica/state pair at a time.
+        """
+        return None
@@ -0,0 +1,71 @@
+"""
+Tests of the readers of Impact output files.
+
+   python impact_async_re_test.py
+"""
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+
+package_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, package_dir)
+from tempt_async_re import tempt_async_re_job
+
+# output of an Impact minimization and thermalization, whose records have
+# two lines of numbers like those of the temperature RE adaptor
+sample_out = os.path.join(package_dir, "examples", "temperature_RE", "linearwt_mintherm.out")
+
+
+class impact_data_test(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.job = tempt_async_re_job.__new__(tempt_async_re_job)
+        f = open(sample_out)
+        self.text = f.read()
+        f.close()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def _write(self, text):
+        filename = os.path.join(self.directory, "sample.out")
+        f = open(filename, "w")
+        f.write(text)
+        f.close()
+        return filename
+
+    def _assertLastRecord(self, filename):
+        data = self.job._getImpactData(filename)
+        self.assertTrue(len(data) > 1)
+        # small blocks, so that the backward scan takes several steps
+        for blocksize in (8192, 64):
+            self.assertEqual(self.job._getImpactLastData(filename, blocksize), data[-1])
+
+    def test_last_record(self):
+        self._assertLastRecord(sample_out)
+
+    def test_truncated_trailer(self):
+        # output stopped after the last record, within the closing messages
+        end = self.text.index("%IMPACT-I (memstat)")
+        self._assertLastRecord(self._write(self.text[:end + 20]))
+
+    def test_truncated_last_record(self):
+        # output stopped in the middle of the numbers of the last record:
+        # both readers fail in the same way
+        start = self.text.rindex(" Step number:")
+        end = self.text.index("\n", self.text.index("\n", start) + 1) + 8
+        filename = self._write(self.text[:end])
+        self.assertRaises(SystemExit, self.job._getImpactData, filename)
+        self.assertRaises(SystemExit, self.job._getImpactLastData, filename)
+
+    def test_no_records(self):
+        filename = self._write(self.text[:self.text.index(" Step number:")])
+        self.assertEqual(self.job._getImpactData(filename), [])
+        self.assertEqual(self.job._getImpactLastData(filename), None)
+
+
+if __name__ == '__main__':
+    unittest.main()
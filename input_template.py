@@ -0,0 +1,57 @@
+"""
+Compiled templates for MD engine input files.
+
+The input file of each replica is generated from the BASENAME.inp template
+by replacing placeholders of the form @name@ (@n@, @nm1@, @lambda@,
+@temperature@, etc.). Rather than reading the template from disk and running
+one str.replace() pass per placeholder for every replica and cycle, the
+template is read once and split at the placeholders; rendering it is then a
+single join.
+"""
+import os
+import re
+
+class input_template(object):
+    """
+    A template split into literal text and placeholder names.
+    """
+    def __init__(self, text, names):
+        # text: template text
+        # names: names of the placeholders to substitute, other @...@
+        #        sequences are left untouched
+        names = sorted(names, key=len, reverse=True)
+        pattern = re.compile('@(%s)@' % '|'.join([re.escape(name) for name in names]))
+        pieces = pattern.split(text)
+        # literal text and placeholder names alternate
+        self.literals = pieces[0::2]
+        self.names = pieces[1::2]
+
+    def render(self, values):
+        """
+        Returns the template text with placeholders replaced by values[name].
+        """
+        buffer = [self.literals[0]]
+        for name, literal in zip(self.names, self.literals[1:]):
+            buffer.append(values[name])
+            buffer.append(literal)
+        return ''.join(buffer)
+
+# compiled templates keyed by file name and placeholder names
+_templates = {}
+
+def render_template(filename, values, openfile=open):
+    """
+    Returns the contents of the template file filename with the @name@
+    placeholders replaced by values[name]. The template is read and compiled
+    on first use and again only if the file is modified.
+    """
+    mtime = os.path.getmtime(filename)
+    key = (filename, tuple(sorted(values.keys())))
+    entry = _templates.get(key)
+    if entry is None or entry[0] != mtime:
+        f = openfile(filename, "r")
+        text = f.read()
+        f.close()
+        entry = (mtime, input_template(text, values.keys()))
+        _templates[key] = entry
+    return entry[1].render(values)
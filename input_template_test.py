@@ -0,0 +1,90 @@
+"""
+Tests of the compiled input file templates against the chained str.replace()
+calls they replace, using the template of the BEDAM example.
+
+   python input_template_test.py
+"""
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+
+package_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, package_dir)
+from input_template import render_template
+
+example = os.path.join(package_dir, "examples", "bcd_benzene_BEDAM_RE", "binding.inp")
+
+
+def chained_replace(text, values):
+    for name in values:
+        text = text.replace("@%s@" % name, values[name])
+    return text
+
+
+class render_template_test(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.template = os.path.join(self.directory, "binding.inp")
+        shutil.copy(example, self.template)
+        f = open(example)
+        self.text = f.read()
+        f.close()
+        self.opened = []
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def _open(self, name, mode):
+        self.opened.append(name)
+        return open(name, mode)
+
+    def _values(self, replica, cycle):
+        return {"n": str(cycle), "nm1": str(cycle - 1), "lambda": "0.%d" % replica,
+                "temperature": "300.0", "jobname": "binding",
+                "replica": str(replica), "cycle": str(cycle)}
+
+    def test_same_as_replace(self):
+        for replica in range(3):
+            for cycle in range(1, 4):
+                values = self._values(replica, cycle)
+                rendered = render_template(self.template, values, self._open)
+                self.assertEqual(rendered, chained_replace(self.text, values))
+                self.assertFalse("@n@" in rendered or "@lambda@" in rendered)
+        # read once for all of the replicas and cycles
+        self.assertEqual(self.opened, [self.template])
+
+    def test_placeholders(self):
+        # adjacent placeholders, names that are prefixes of others and
+        # placeholders that are not substituted
+        f = open(self.template, "a")
+        f.write("@n@@nm1@ @temp@ @@ @jobname\n")
+        f.close()
+        f = open(self.template)
+        text = f.read()
+        f.close()
+        values = self._values(1, 2)
+        rendered = render_template(self.template, values)
+        self.assertEqual(rendered, chained_replace(text, values))
+        self.assertTrue(rendered.endswith("21 @temp@ @@ @jobname\n"))
+
+    def test_modified(self):
+        values = self._values(0, 1)
+        render_template(self.template, values, self._open)
+        mtime = os.path.getmtime(self.template)
+
+        f = open(self.template, "a")
+        f.write("! cycle @n@ of @jobname@\n")
+        f.close()
+        os.utime(self.template, (mtime + 1, mtime + 1))
+        rendered = render_template(self.template, values, self._open)
+        self.assertTrue(rendered.endswith("! cycle 1 of binding\n"))
+        self.assertEqual(self.opened, [self.template, self.template])
+        render_template(self.template, values, self._open)
+        self.assertEqual(len(self.opened), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
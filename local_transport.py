@@ -0,0 +1,238 @@
+"""
+Local job transport for AsyncRE
+
+Runs replicas as subprocesses of the scheduler directly in their replica
+directories (r0, r1, ...) on the local machine, with no copying of files to
+and from a temporary folder. The TOTAL_CORES cores of the machine are divided
+into slots of SUBJOB_CORES cores each; a job runs on one slot with
+OMP_NUM_THREADS set to the number of threads per slot (SUBJOB_THREADS,
+SUBJOB_CORES by default) and, if taskset is available, bound to the cores of
+its slot.
+"""
+import os
+import sys
+import time
+import logging
+import subprocess
+import multiprocessing
+import Queue
+
+from transport import Transport
+
+
+class local_transport(Transport):
+    """
+    Class to launch and monitor jobs as local subprocesses
+    """
+
+    def __init__(self, jobname, keywords, nreplicas):
+        # jobname: identifies current asyncRE job
+        # keywords: settings from the control file
+        # nreplicas: number of replicas, 0 ... nreplicas-1
+        Transport.__init__(self)
+        self.logger = logging.getLogger("async_re.local_transport")
+
+        self.jobname = jobname
+
+        # slots of SUBJOB_CORES cores each
+        cores = {}
+        for keyword in ('TOTAL_CORES', 'SUBJOB_CORES'):
+            try:
+                cores[keyword] = int(keywords.get(keyword))
+            except (TypeError, ValueError):
+                cores[keyword] = 0
+            if cores[keyword] < 1:
+                self.logger.critical("LOCAL transport requires a positive integer %s, got %s",
+                                     keyword, keywords.get(keyword))
+                sys.exit(1)
+        self.subjob_cores = cores['SUBJOB_CORES']
+        self.nslots = cores['TOTAL_CORES'] / self.subjob_cores
+        if self.nslots < 1:
+            self.logger.critical("TOTAL_CORES (%d) is smaller than SUBJOB_CORES (%d)",
+                                 cores['TOTAL_CORES'], self.subjob_cores)
+            sys.exit(1)
+        if keywords.get('SUBJOB_THREADS') is not None:
+            self.nthreads = int(keywords.get('SUBJOB_THREADS'))
+        else:
+            self.nthreads = self.subjob_cores
+
+        # binds jobs to the cores of their slot if taskset is available and
+        # the slots fit on the cores of the machine
+        self.taskset = None
+        for directory in os.environ.get('PATH', '').split(os.pathsep):
+            if os.access(os.path.join(directory, 'taskset'), os.X_OK):
+                self.taskset = os.path.join(directory, 'taskset')
+                break
+        if self.taskset and self.nslots * self.subjob_cores > multiprocessing.cpu_count():
+            self.logger.warning("TOTAL_CORES exceeds the %d cores of this machine, jobs are not bound to cores",
+                                multiprocessing.cpu_count())
+            self.taskset = None
+
+        # free slots, slot_status = replica running on the slot or None if
+        # idle
+        self.free_slots = range(self.nslots - 1, -1, -1)
+        self.slot_status = [None for k in range(self.nslots)]
+
+        # job of each replica, None = no information about the replica
+        self.replica_to_job = [None for k in range(nreplicas)]
+
+        # implements a queue of jobs from which to draw the next job
+        # to launch
+        self.jobqueue = Queue.Queue()
+
+        # replica directories where binaries and libraries are already linked
+        self.linked = set()
+
+    def _clear_resource(self, replica):
+        # frees up the slot running a replica
+        job = self.replica_to_job[replica]
+        if job == None:
+            return None
+        slot = job.get('slotid')
+        if slot != None and self.slot_status[slot] == replica:
+            self.slot_status[slot] = None
+            self.free_slots.append(slot)
+        return slot
+
+    def _linkExecFiles(self, job):
+        # links binaries and libraries of the MD engine into the replica
+        # directory, in place of the copies made by the SSH transport
+        exec_directory = job.get("exec_directory")
+        if not exec_directory:
+            return
+        key = (job["working_directory"], exec_directory)
+        if key in self.linked:
+            return
+        for subdir in ("lib", "bin"):
+            directory = exec_directory + "/" + subdir
+            if not os.path.isdir(directory):
+                continue
+            for filename in os.listdir(directory):
+                source = directory + "/" + filename
+                if not os.path.isfile(source):
+                    # architecture subdirectories are for remote nodes
+                    continue
+                link = job["working_directory"] + "/" + filename
+                if os.path.islink(link):
+                    os.remove(link)
+                elif os.path.exists(link):
+                    # leave alone a file of the replica with the same name
+                    continue
+                os.symlink(source, link)
+        self.linked.add(key)
+
+    def launchJob(self, replica, job_info):
+        """
+        Enqueues a job based on provided job info.
+        """
+        input_file = job_info["input_file"]
+        output_file = job_info["output_file"]
+        error_file = job_info["error_file"]
+        executable = job_info["executable"]
+
+        command = "%s %s > %s 2> %s " % (executable, input_file, output_file, error_file)
+
+        job = job_info
+        job['replica'] = replica
+        job['command'] = command
+        job['process_handle'] = None
+
+        self.replica_to_job[replica] = job
+
+        self.jobqueue.put(replica)
+
+        # starts the job right away if a slot is free, so that it does not
+        # depend on a later call to ProcessJobQueue()
+        self._launchQueuedJobs()
+
+        return self.jobqueue.qsize()
+
+    def _launchQueuedJobs(self):
+        # starts queued jobs on the free slots, returns how many
+        njobs_launched = 0
+        while (not self.jobqueue.empty()) and self.free_slots:
+
+            # grabs job on top of the queue
+            replica = self.jobqueue.get()
+            job = self.replica_to_job[replica]
+
+            slot = self.free_slots.pop()
+            job['slotid'] = slot
+            job['process_handle'] = self._launchCmd(job['command'], job)
+
+            # connects slot to replica
+            self.slot_status[slot] = replica
+
+            njobs_launched += 1
+        return njobs_launched
+
+    def _launchCmd(self, command, job):
+        # starts a job on its slot, returns the process handle
+        slot = job['slotid']
+        env = dict(os.environ)
+        env['OMP_NUM_THREADS'] = str(self.nthreads)
+        if self.taskset:
+            start = slot * self.subjob_cores
+            end = (slot + 1) * self.subjob_cores - 1
+            command = "%s -c %d-%d %s" % (self.taskset, start, end, command)
+        self._linkExecFiles(job)
+        return subprocess.Popen(command, shell=True, cwd=job["working_directory"], env=env)
+
+    def ProcessJobQueue(self, mintime, maxtime, return_on_completion=False):
+        """
+        Launches jobs waiting in the queue.
+        It will scan free slots and job queue up to maxtime.
+        If the queue becomes empty, it will still block until maxtime is elapsed,
+        unless return_on_completion is set, in which case it returns as soon as
+        a running job has completed.
+        """
+        njobs_launched = 0
+        usetime = 0
+
+        while usetime < maxtime:
+
+            njobs_launched += self._launchQueuedJobs()
+
+            # waits mintime second and rescans job queue
+            time.sleep(mintime)
+
+            # frees the slots of replicas that have exited
+            ncompleted = 0
+            for slot in range(self.nslots):
+                replica = self.slot_status[slot]
+                if replica != None and self.isDone(replica, 0):
+                    ncompleted += 1
+
+            usetime += mintime
+
+            if return_on_completion and ncompleted > 0:
+                break
+
+        return njobs_launched
+
+    def isDone(self, replica, cycle):
+        """
+        Checks if a replica completed a run.
+
+        If a replica is done it clears the corresponding slot and starts the
+        next queued job on it.
+        Note that cycle is ignored by job transport. It is assumed that it is
+        the latest cycle.  it's kept for argument compatibility with
+        hasCompleted() elsewhere.
+        """
+        job = self.replica_to_job[replica]
+        if job == None:
+            # if job has been removed we assume that the replica is done
+            return True
+        process = job['process_handle']
+        if process == None:
+            return False
+        status = process.poll()
+        if status == None:
+            return False
+        # disconnects replica from job and slot
+        self._clear_resource(replica)
+        self.logger.info("r%s exited with status %s", replica, status)
+        self.replica_to_job[replica] = None
+        self._launchQueuedJobs()
+        return True
@@ -0,0 +1,109 @@
+"""
+Runs the DATE example with the LOCAL transport and the event-driven
+scheduling loop to completion.
+
+   python local_transport_test.py
+"""
+import os
+import sys
+import time
+import shutil
+import signal
+import logging
+import tempfile
+import subprocess
+import unittest
+
+package_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, package_dir)
+from replica_status import status_journal
+from local_transport import local_transport
+
+control_file = """JOB_TRANSPORT = 'LOCAL'
+RE_TYPE = 'DATE'
+ENGINE_INPUT_BASENAME = 'dt'
+RE_SETUP = 'yes'
+NREPLICAS = 6
+WALL_TIME = 0.4
+REPLICA_RUN_TIME = 0
+TOTAL_CORES = 2
+SUBJOB_CORES = 1
+VERBOSE = 'no'
+CYCLE_TIME = 2
+MIN_TIME = 0.2
+EVENT_DRIVEN = 'yes'
+"""
+
+dodate = """#!/bin/sh
+sleep 1
+/bin/date
+"""
+
+
+class local_event_test(unittest.TestCase):
+
+    # seconds allowed to the run beyond its WALL_TIME
+    timeout = 60
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        f = open(os.path.join(self.directory, "date.cntl"), "w")
+        f.write(control_file)
+        f.close()
+        filename = os.path.join(self.directory, "dodate")
+        f = open(filename, "w")
+        f.write(dodate)
+        f.close()
+        os.chmod(filename, 0o755)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_event_driven_run_completes(self):
+        env = dict(os.environ)
+        env['PATH'] = self.directory + os.pathsep + env.get('PATH', '')
+        log = open(os.path.join(self.directory, "date.log"), "w")
+        process = subprocess.Popen([sys.executable, os.path.join(package_dir, "date_async_re.py"), "date.cntl"],
+                                   cwd=self.directory, env=env, stdout=log, stderr=subprocess.STDOUT)
+        deadline = time.time() + 0.4 * 60 + self.timeout
+        while process.poll() is None and time.time() < deadline:
+            time.sleep(1)
+        log.close()
+        if process.poll() is None:
+            process.send_signal(signal.SIGKILL)
+            process.wait()
+            self.fail("the scheduler did not terminate")
+        self.assertEqual(process.returncode, 0)
+
+        # all replicas ran more than one cycle and none is left running
+        status = status_journal(os.path.join(self.directory, "dt"), 100).read()
+        self.assertEqual(len(status), 6)
+        for replica in status:
+            self.assertEqual(replica['running_status'], 'W')
+            self.assertTrue(replica['cycle_current'] > 1)
+
+class local_slots_test(unittest.TestCase):
+
+    def setUp(self):
+        self.logger = logging.getLogger("async_re")
+        self.level = self.logger.level
+        self.logger.setLevel(logging.CRITICAL + 1)
+
+    def tearDown(self):
+        self.logger.setLevel(self.level)
+
+    def test_slots(self):
+        transport = local_transport("job", {'TOTAL_CORES': '5', 'SUBJOB_CORES': '2'}, 3)
+        self.assertEqual(transport.nslots, 2)
+        self.assertEqual(transport.nthreads, 2)
+
+    def test_invalid_cores(self):
+        for keywords in ({}, {'TOTAL_CORES': '4'}, {'SUBJOB_CORES': '1'},
+                         {'TOTAL_CORES': 'four', 'SUBJOB_CORES': '1'},
+                         {'TOTAL_CORES': '4', 'SUBJOB_CORES': '0'},
+                         {'TOTAL_CORES': '1', 'SUBJOB_CORES': '2'}):
+            self.assertRaises(SystemExit, local_transport, "job", keywords, 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,217 @@
+"""
+Pilot job transport for AsyncRE
+
+Rather than starting a new SSH session, BOINC workunit or Condor job for
+each replica cycle, long-lived worker processes (pilot_worker.py) are
+started once per allocation, on the local machine or on the nodes of a batch
+allocation through any launcher (mpirun, srun, pbsdsh, ssh, ...). Workers
+connect to the scheduler and pull replica tasks from it one at a time,
+reporting the exit status of each back when done. Replica directories are
+assumed to be on a filesystem shared with the workers.
+
+The scheduler listens at PILOT_ADDRESS (host:port, localhost on a port
+chosen by the system by default) and writes the address and the
+authentication key for the workers to BASENAME.pilot, which is what workers
+are started with:
+
+   python pilot_worker.py BASENAME.pilot [scratch directory] [arch]
+
+PILOT_WORKERS local workers (none by default) are started by the scheduler
+itself. A task whose worker disconnects before reporting is queued again.
+"""
+import os
+import sys
+import time
+import socket
+import logging
+import subprocess
+import threading
+import Queue
+from multiprocessing.connection import Listener
+
+from transport import Transport
+
+
+class pilot_transport(Transport):
+    """
+    Class to hand out jobs to pull-based pilot workers
+    """
+
+    def __init__(self, jobname, keywords, nreplicas):
+        # jobname: identifies current asyncRE job
+        # keywords: settings from the control file
+        # nreplicas: number of replicas, 0 ... nreplicas-1
+        Transport.__init__(self)
+        self.logger = logging.getLogger("async_re.pilot_transport")
+
+        self.jobname = jobname
+
+        # threads of a job
+        if keywords.get('SUBJOB_THREADS') is not None:
+            self.nthreads = int(keywords.get('SUBJOB_THREADS'))
+        else:
+            self.nthreads = int(keywords.get('SUBJOB_CORES'))
+
+        # job of each replica, None = no information about the replica
+        self.replica_to_job = [None for k in range(nreplicas)]
+
+        # queue of replicas waiting for a worker, and of replicas whose job
+        # has been reported done
+        self.jobqueue = Queue.Queue()
+        self.completed = Queue.Queue()
+
+        # listens for workers
+        address = keywords.get('PILOT_ADDRESS')
+        if address is None:
+            address = 'localhost:0'
+        host, port = address.rsplit(':', 1)
+        authkey = os.urandom(16).encode('hex')
+        self.listener = Listener((host, int(port)), authkey=authkey)
+        (host, port) = self.listener.address
+        if host in ('', '0.0.0.0'):
+            host = socket.gethostname()
+        self.pilot_file = "%s.pilot" % jobname
+        fd = os.open(self.pilot_file, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0600)
+        os.write(fd, "%s %d %s\n" % (host, port, authkey))
+        os.close(fd)
+        self.logger.info("Waiting for pilot workers at %s:%d", host, port)
+
+        thread = threading.Thread(target=self._acceptWorkers)
+        thread.daemon = True
+        thread.start()
+
+        # local workers
+        self.workers = []
+        nworkers = 0
+        if keywords.get('PILOT_WORKERS') is not None:
+            nworkers = int(keywords.get('PILOT_WORKERS'))
+        worker_script = os.path.join(os.path.dirname(os.path.abspath(__file__)), "pilot_worker.py")
+        for k in range(nworkers):
+            self.workers.append(subprocess.Popen([sys.executable, worker_script, self.pilot_file]))
+
+    def _acceptWorkers(self):
+        # serves each worker that connects in a thread of its own
+        while True:
+            try:
+                conn = self.listener.accept()
+            except Exception as e:
+                self.logger.warning("Rejected pilot worker connection: %s", e)
+                continue
+            thread = threading.Thread(target=self._serveWorker, args=(conn,))
+            thread.daemon = True
+            thread.start()
+
+    def _serveWorker(self, conn):
+        """
+        Answers the requests of a worker: ('get',) is answered with the next
+        task, waiting for one if the queue is empty; ('done', replica,
+        status) reports the completion of a task.
+        """
+        worker = None
+        replica = None
+        try:
+            while True:
+                request = conn.recv()
+                if request[0] == 'hello':
+                    worker = request[1]
+                    self.logger.info("Pilot worker %s connected", worker)
+                elif request[0] == 'get':
+                    replica = self.jobqueue.get()
+                    conn.send(self._task(replica))
+                elif request[0] == 'done':
+                    self._jobDone(request[1], request[2])
+                    replica = None
+        except (EOFError, IOError):
+            self.logger.warning("Pilot worker %s disconnected", worker)
+            if replica != None:
+                # the job was not completed, hand it to another worker
+                self.logger.warning("Requeueing r%d", replica)
+                self.jobqueue.put(replica)
+        conn.close()
+
+    def _task(self, replica):
+        # what a worker needs to run the job of a replica
+        job = self.replica_to_job[replica]
+        return {'replica': replica,
+                'command': job['command'],
+                'working_directory': job['working_directory'],
+                'exec_directory': job.get('exec_directory'),
+                'nthreads': self.nthreads}
+
+    def _jobDone(self, replica, status):
+        job = self.replica_to_job[replica]
+        if job != None:
+            job['exit_status'] = status
+        self.completed.put(replica)
+
+    def launchJob(self, replica, job_info):
+        """
+        Enqueues a job based on provided job info.
+        """
+        input_file = job_info["input_file"]
+        output_file = job_info["output_file"]
+        error_file = job_info["error_file"]
+        executable = job_info["executable"]
+
+        command = "%s %s > %s 2> %s " % (executable, input_file, output_file, error_file)
+
+        job = job_info
+        job['replica'] = replica
+        job['command'] = command
+        job['exit_status'] = None
+
+        self.replica_to_job[replica] = job
+
+        self.jobqueue.put(replica)
+
+        return self.jobqueue.qsize()
+
+    def ProcessJobQueue(self, mintime, maxtime, return_on_completion=False):
+        """
+        Workers pull jobs from the queue by themselves, this just waits up to
+        maxtime. If return_on_completion is set it returns as soon as a job
+        has completed that isDone() has not reported yet.
+        """
+        # drops the completions reported before this call, returning right
+        # away only if some of them have not been harvested yet
+        unharvested = False
+        while True:
+            try:
+                replica = self.completed.get_nowait()
+            except Queue.Empty:
+                break
+            job = self.replica_to_job[replica]
+            if job != None and job['exit_status'] != None:
+                unharvested = True
+        if unharvested and return_on_completion:
+            return
+
+        start_time = time.time()
+        usetime = 0
+        while usetime < maxtime:
+            try:
+                self.completed.get(timeout=min(mintime, maxtime - usetime))
+            except Queue.Empty:
+                pass
+            else:
+                if return_on_completion:
+                    break
+            usetime = time.time() - start_time
+
+    def isDone(self, replica, cycle):
+        """
+        Checks if a replica completed a run.
+
+        Note that cycle is ignored by job transport. It is assumed that it is
+        the latest cycle.  it's kept for argument compatibility with
+        hasCompleted() elsewhere.
+        """
+        job = self.replica_to_job[replica]
+        if job == None:
+            # if job has been removed we assume that the replica is done
+            return True
+        if job['exit_status'] == None:
+            return False
+        self.logger.info("r%s exited with status %s", replica, job['exit_status'])
+        self.replica_to_job[replica] = None
+        return True
@@ -0,0 +1,107 @@
+"""
+Pilot worker for the AsyncRE pilot transport
+
+Connects to the scheduler at the address in BASENAME.pilot and runs replica
+tasks one after the other until the scheduler goes away. Binaries and
+libraries of the MD engine are linked into each replica directory the first
+time the worker runs a task there. If a scratch directory (e.g. on a node
+local disk) is given, they are copied there once and linked from there.
+
+Usage: python pilot_worker.py <pilot file> [scratch directory] [arch]
+"""
+import os
+import sys
+import shutil
+import socket
+import subprocess
+from multiprocessing.connection import Client
+
+
+class pilot_worker(object):
+
+    def __init__(self, pilot_file, scratch=None, arch=""):
+        f = open(pilot_file, 'r')
+        (host, port, authkey) = f.readline().split()
+        f.close()
+        self.conn = Client((host, int(port)), authkey=authkey)
+        self.scratch = scratch
+        self.arch = arch
+        # replica directories where the engine is already linked
+        self.linked = set()
+        # copies in the scratch directory, keyed by source file
+        self.copies = {}
+
+    def _warmCopy(self, source):
+        # copy of a file in the scratch directory, made again only if the
+        # source has changed
+        mtime = os.path.getmtime(source)
+        entry = self.copies.get(source)
+        if entry == None or entry[0] != mtime:
+            copy = os.path.join(self.scratch, "%d_%s" % (len(self.copies), os.path.basename(source)))
+            shutil.copy2(source, copy)
+            entry = (mtime, copy)
+            self.copies[source] = entry
+        return entry[1]
+
+    def _linkExecFiles(self, task):
+        exec_directory = task['exec_directory']
+        if not exec_directory:
+            return
+        key = (task['working_directory'], exec_directory)
+        if key in self.linked:
+            return
+        for subdir in ("lib", "bin"):
+            directory = os.path.join(exec_directory, subdir, self.arch)
+            if not os.path.isdir(directory):
+                continue
+            for filename in os.listdir(directory):
+                source = os.path.join(directory, filename)
+                if not os.path.isfile(source):
+                    continue
+                if self.scratch:
+                    source = self._warmCopy(source)
+                link = os.path.join(task['working_directory'], filename)
+                if os.path.islink(link):
+                    os.remove(link)
+                elif os.path.exists(link):
+                    continue
+                os.symlink(source, link)
+        self.linked.add(key)
+
+    def run(self):
+        self.conn.send(('hello', "%s:%d" % (socket.gethostname(), os.getpid())))
+        while True:
+            try:
+                self.conn.send(('get',))
+                task = self.conn.recv()
+            except (EOFError, IOError):
+                # the scheduler is gone
+                break
+            self._linkExecFiles(task)
+            env = dict(os.environ)
+            env['OMP_NUM_THREADS'] = str(task['nthreads'])
+            status = subprocess.call(task['command'], shell=True,
+                                     cwd=task['working_directory'], env=env)
+            try:
+                self.conn.send(('done', task['replica'], status))
+            except (EOFError, IOError):
+                break
+        self.conn.close()
+
+
+if __name__ == '__main__':
+
+    if len(sys.argv) < 2 or len(sys.argv) > 4:
+        print "Usage: python pilot_worker.py <pilot file> [scratch directory] [arch]"
+        sys.exit(1)
+
+    scratch = None
+    if len(sys.argv) > 2:
+        scratch = sys.argv[2]
+        if not os.path.isdir(scratch):
+            os.makedirs(scratch)
+    arch = ""
+    if len(sys.argv) > 3:
+        arch = sys.argv[3]
+
+    pilot_worker(sys.argv[1], scratch, arch).run()
@@ -0,0 +1,185 @@
+"""
+Replica status table for AsyncRE.
+
+The status of each replica is kept, as before, in a dictionary with keys
+'stateid_current', 'running_status' and 'cycle_current' accessed as
+self.status[replica][key]. In addition the table maintains, for each running
+status (W = waiting, R = running, S = stopped/harvesting, E = exchanging), the
+set of replicas currently in that status. The sets are updated as transitions
+happen, so that the lists and counts of waiting and running replicas needed
+at every scheduling loop do not require scanning all of the replicas.
+
+The table also records which replicas changed since it was last saved. The
+status_journal class uses this to append only those replicas to a journal
+file rather than re-pickling the whole table at every scheduling loop.
+"""
+import os
+import pickle
+
+class replica_record(dict):
+    """
+    Status of a single replica. Changes of 'running_status' are reported to
+    the owning table to keep its per-status index sets current.
+    """
+    def __init__(self, table, replica, status):
+        dict.__init__(self, status)
+        self._table = table
+        self._replica = replica
+
+    def __setitem__(self, key, value):
+        if key == 'running_status':
+            self._table._move(self._replica, self.get(key), value)
+        if self.get(key) != value:
+            self._table._changed.add(self._replica)
+        dict.__setitem__(self, key, value)
+
+class replica_status_table(object):
+    """
+    List-like container of replica status records indexed by running status.
+    """
+    def __init__(self, status):
+        # status: list of status dictionaries, one for each replica
+        self._index = {'W': set(), 'R': set(), 'S': set(), 'E': set()}
+        self._changed = set()
+        self._records = []
+        for k in range(len(status)):
+            record = replica_record(self, k, status[k])
+            self._index.setdefault(record['running_status'], set()).add(k)
+            self._records.append(record)
+
+    def _move(self, replica, old, new):
+        if old == new:
+            return
+        if old is not None:
+            self._index[old].discard(replica)
+        self._index.setdefault(new, set()).add(replica)
+
+    def __getitem__(self, replica):
+        return self._records[replica]
+
+    def __len__(self):
+        return len(self._records)
+
+    def __iter__(self):
+        return iter(self._records)
+
+    def replicas(self, running_status):
+        """
+        Returns the sorted list of replicas with the given running status.
+        """
+        return sorted(self._index.get(running_status, ()))
+
+    def count(self, running_status):
+        """
+        Returns the number of replicas with the given running status.
+        """
+        return len(self._index.get(running_status, ()))
+
+    def as_list(self):
+        """
+        Returns the status table as a plain list of dictionaries, the format
+        of the BASENAME.stat file.
+        """
+        return [dict(record) for record in self._records]
+
+    def pop_changed(self):
+        """
+        Returns the sorted list of replicas whose status changed since the
+        last call and resets the list.
+        """
+        changed = sorted(self._changed)
+        self._changed.clear()
+        return changed
+
+class status_journal(object):
+    """
+    Append-only journal of replica status transitions.
+
+    BASENAME.stat holds a pickled snapshot of the status table (a list of
+    dictionaries, as before). Replicas whose status changed since the last
+    save are appended to BASENAME.stat.journal as lines of the form:
+
+    replica stateid running_status cycle
+
+    Every compact_interval records the journal is folded into a new snapshot,
+    which is written to a temporary file and renamed over BASENAME.stat so
+    that a crash can not leave a partially written snapshot. On restart the
+    journal is replayed on top of the snapshot; an incomplete last line, left
+    by a crash in the middle of an append, is ignored.
+
+    Files are opened with opener(name, mode), e.g. the retrying _open() of
+    async_re on unstable filesystems.
+    """
+    def __init__(self, basename, compact_interval, opener=open):
+        self.snapshot_file = '%s.stat' % basename
+        self.journal_file = '%s.stat.journal' % basename
+        self.compact_interval = compact_interval
+        self.opener = opener
+        self.nrecords = 0
+        self._journal = None
+
+    def read(self):
+        """
+        Returns the list of status dictionaries obtained by replaying the
+        journal on top of the snapshot.
+        """
+        f = self.opener(self.snapshot_file, 'r')
+        status = pickle.load(f)
+        f.close()
+        if not os.path.exists(self.journal_file):
+            return status
+        f = self.opener(self.journal_file, 'r')
+        for line in f:
+            words = line.split()
+            if not line.endswith('\n') or len(words) != 4:
+                # torn write
+                break
+            status[int(words[0])] = {'stateid_current': int(words[1]),
+                                     'running_status': words[2],
+                                     'cycle_current': int(words[3])}
+        f.close()
+        return status
+
+    def append(self, table):
+        """
+        Appends to the journal the replicas of the status table that changed
+        since the last call. Compacts the journal when it grows past
+        compact_interval records.
+        """
+        self._write_records(table)
+        if self.nrecords >= self.compact_interval:
+            self.snapshot(table)
+
+    def _write_records(self, table):
+        changed = table.pop_changed()
+        if not changed:
+            return
+        if self._journal is None:
+            self._journal = self.opener(self.journal_file, 'a')
+        records = ''
+        for k in changed:
+            records += '%d %d %s %d\n' % (k, table[k]['stateid_current'],
+                                          table[k]['running_status'],
+                                          table[k]['cycle_current'])
+        self._journal.write(records)
+        self._journal.flush()
+        self.nrecords += len(changed)
+
+    def snapshot(self, table):
+        """
+        Writes a full snapshot of the status table and empties the journal.
+        """
+        # pending changes go to the journal first, so that replaying it on
+        # top of the new snapshot is harmless if we crash before truncating it
+        self._write_records(table)
+        tmp_file = '%s.tmp' % self.snapshot_file
+        f = self.opener(tmp_file, 'w')
+        pickle.dump(table.as_list(), f)
+        f.flush()
+        os.fsync(f.fileno())
+        f.close()
+        os.rename(tmp_file, self.snapshot_file)
+        if self._journal is not None:
+            self._journal.close()
+        self._journal = self.opener(self.journal_file, 'w')
+        self.nrecords = 0
@@ -0,0 +1,160 @@
+"""
+Tests of the replica status table and of the journal of its transitions.
+
+   python replica_status_test.py
+"""
+import os
+import sys
+import shutil
+import pickle
+import tempfile
+import unittest
+
+package_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, package_dir)
+from replica_status import replica_status_table, status_journal
+
+
+def initial_status(nreplicas):
+    return [{'stateid_current': k, 'running_status': 'W', 'cycle_current': 1}
+            for k in range(nreplicas)]
+
+
+class replica_status_table_test(unittest.TestCase):
+
+    def test_index(self):
+        table = replica_status_table(initial_status(4))
+        self.assertEqual(table.replicas('W'), [0, 1, 2, 3])
+        self.assertEqual(table.pop_changed(), [])
+
+        table[2]['running_status'] = 'R'
+        table[0]['running_status'] = 'R'
+        table[0]['running_status'] = 'S'
+        table[1]['cycle_current'] = 2
+        # not a change
+        table[3]['running_status'] = 'W'
+        self.assertEqual(table.replicas('W'), [1, 3])
+        self.assertEqual(table.replicas('R'), [2])
+        self.assertEqual(table.replicas('S'), [0])
+        self.assertEqual(table.count('E'), 0)
+        self.assertEqual(table.pop_changed(), [0, 1, 2])
+        self.assertEqual(table.pop_changed(), [])
+        self.assertEqual(table.as_list()[0],
+                         {'stateid_current': 0, 'running_status': 'S', 'cycle_current': 1})
+
+
+class status_journal_test(unittest.TestCase):
+
+    nreplicas = 4
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.basename = os.path.join(self.directory, "job")
+        self.table = replica_status_table(initial_status(self.nreplicas))
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def _journal_lines(self):
+        f = open(self.basename + ".stat.journal")
+        lines = f.readlines()
+        f.close()
+        return lines
+
+    def test_replay(self):
+        journal = status_journal(self.basename, 100)
+        journal.snapshot(self.table)
+        self.table[1]['running_status'] = 'R'
+        journal.append(self.table)
+        self.table[1]['running_status'] = 'W'
+        self.table[1]['cycle_current'] = 2
+        self.table[3]['stateid_current'] = 0
+        self.table[0]['stateid_current'] = 3
+        journal.append(self.table)
+        # nothing changed, nothing written
+        journal.append(self.table)
+        self.assertEqual(self._journal_lines(), ["1 1 R 1\n", "0 3 W 1\n", "1 1 W 2\n", "3 0 W 1\n"])
+
+        # the snapshot alone is the initial status
+        f = open(self.basename + ".stat")
+        self.assertEqual(pickle.load(f), initial_status(self.nreplicas))
+        f.close()
+        self.assertEqual(status_journal(self.basename, 100).read(), self.table.as_list())
+
+    def test_torn_last_line(self):
+        journal = status_journal(self.basename, 100)
+        journal.snapshot(self.table)
+        self.table[2]['running_status'] = 'R'
+        journal.append(self.table)
+        expected = self.table.as_list()
+
+        # a crash in the middle of an append
+        f = open(self.basename + ".stat.journal", "a")
+        f.write("2 2 W")
+        f.close()
+        self.assertEqual(status_journal(self.basename, 100).read(), expected)
+
+        # and one that left a complete but malformed line
+        f = open(self.basename + ".stat.journal", "a")
+        f.write("\n3 3 R 2\n")
+        f.close()
+        self.assertEqual(status_journal(self.basename, 100).read(), expected)
+
+    def test_compaction(self):
+        journal = status_journal(self.basename, 3)
+        journal.snapshot(self.table)
+        self.table[0]['running_status'] = 'R'
+        self.table[1]['running_status'] = 'R'
+        journal.append(self.table)
+        self.assertEqual(len(self._journal_lines()), 2)
+
+        # the third record folds the journal into a new snapshot
+        self.table[2]['running_status'] = 'R'
+        journal.append(self.table)
+        self.assertEqual(self._journal_lines(), [])
+        self.assertFalse(os.path.exists(self.basename + ".stat.tmp"))
+        f = open(self.basename + ".stat")
+        self.assertEqual(pickle.load(f), self.table.as_list())
+        f.close()
+
+        # appends resume on the emptied journal
+        self.table[0]['running_status'] = 'W'
+        journal.append(self.table)
+        self.assertEqual(self._journal_lines(), ["0 0 W 1\n"])
+        self.assertEqual(status_journal(self.basename, 3).read(), self.table.as_list())
+
+    def test_interrupted_snapshot(self):
+        journal = status_journal(self.basename, 100)
+        journal.snapshot(self.table)
+        self.table[1]['running_status'] = 'R'
+        journal.append(self.table)
+        expected = self.table.as_list()
+
+        # a crash while writing the next snapshot leaves a partial
+        # temporary file, the snapshot and the journal are intact
+        f = open(self.basename + ".stat.tmp", "w")
+        f.write("(lp0\n(dp1")
+        f.close()
+        self.assertEqual(status_journal(self.basename, 100).read(), expected)
+
+        # the next snapshot replaces it
+        journal.snapshot(self.table)
+        self.assertFalse(os.path.exists(self.basename + ".stat.tmp"))
+        self.assertEqual(status_journal(self.basename, 100).read(), expected)
+
+    def test_opener(self):
+        opened = []
+        def opener(name, mode):
+            opened.append((os.path.basename(name), mode))
+            return open(name, mode)
+        journal = status_journal(self.basename, 100, opener)
+        journal.snapshot(self.table)
+        self.table[0]['running_status'] = 'R'
+        journal.append(self.table)
+        journal.read()
+        self.assertEqual(opened, [("job.stat.tmp", "w"), ("job.stat.journal", "w"),
+                                  ("job.stat", "r"), ("job.stat.journal", "r")])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -25,9 +25,9 @@ from async_re import __version__ as VERSION
 
 NAME = 'async_re'
 
-MODULES = 'async_re', 'date_async_re', 'impact_async_re', 'bedam_async_re', 'bedamtempt_async_re', 'tempt_async_re', 'gibbs_sampling', 'ssh_transport', 'boinc_transport'
+MODULES = 'async_re', 'date_async_re', 'impact_async_re', 'bedam_async_re', 'bedamtempt_async_re', 'tempt_async_re', 'gibbs_sampling', 'replica_status', 'input_template', 'ssh_transport', 'local_transport', 'pilot_transport', 'pilot_worker', 'boinc_transport', 'boinc_db', 'boinc_simulator'
 
-REQUIRES = 'configobj', 'numpy', 'paramiko', 'scp'
+REQUIRES = 'configobj', 'numpy', 'paramiko'
 
 DESCRIPTION = 'File-Based Asynchronous Replica Exchange.'
 
@@ -6,28 +6,225 @@ import re
 import sys
 import time
 import random
+import select
+import heapq
+import hashlib
+import tarfile
 import paramiko
-import multiprocessing as mp
 import logging
 import Queue
-import subprocess
-# import scp
+import threading
+import collections
 
 from transport import Transport  # WFF - 2/18/15
 
 
+class job_future(object):
+    """
+    Outcome of a remote job session submitted to a job_executor.
+    """
+
+    def __init__(self):
+        self._done = threading.Event()
+        self._result = None
+        self._exception = None
+
+    def done(self):
+        return self._done.is_set()
+
+    def result(self):
+        # what the session returned, None if it raised an exception
+        return self._result
+
+    def exception(self):
+        # the exception raised by the session, if any
+        return self._exception
+
+    def _set(self, result, exception):
+        self._result = result
+        self._exception = exception
+        self._done.set()
+
+
+class job_executor(object):
+    """
+    Bounded pool of I/O threads running remote job sessions.
+
+    Sessions spend their time waiting on the network and on the remote job,
+    so threads are enough; unlike one process per job the memory of the
+    scheduler does not grow with the number of jobs in flight.
+    """
+
+    def __init__(self, nthreads, completed=None):
+        # completed: optional queue that receives the future of each
+        #            session as it ends
+        self.tasks = Queue.Queue()
+        self.completed = completed
+        self.threads = []
+        for k in range(nthreads):
+            thread = threading.Thread(target=self._worker)
+            thread.daemon = True
+            thread.start()
+            self.threads.append(thread)
+
+    def submit(self, function, *args):
+        """
+        Queues function(*args) for execution, returns its job_future.
+        """
+        future = job_future()
+        self.tasks.put((future, function, args))
+        return future
+
+    def _worker(self):
+        while True:
+            (future, function, args) = self.tasks.get()
+            try:
+                result = function(*args)
+            except Exception as e:
+                future._set(None, e)
+            else:
+                future._set(result, None)
+            if self.completed is not None:
+                self.completed.put(future)
+
+
+class slot_set(object):
+    """
+    Set of slots with constant time insertion, removal and random choice.
+    """
+
+    def __init__(self):
+        self.items = []
+        self.position = {}
+
+    def __len__(self):
+        return len(self.items)
+
+    def add(self, slot):
+        if slot not in self.position:
+            self.position[slot] = len(self.items)
+            self.items.append(slot)
+
+    def remove(self, slot):
+        k = self.position.pop(slot)
+        last = self.items.pop()
+        if last != slot:
+            self.items[k] = last
+            self.position[last] = k
+
+    def choice(self):
+        return random.choice(self.items)
+
+
+class slot_pool(object):
+    """
+    Free slots of the compute nodes.
+
+    Slots are acquired and released in constant time (logarithmic in the
+    number of hosts for the 'pack' policy). The placement policy decides
+    which free slot is handed out:
+       random: any free slot at random
+       pack:   a slot of the first host, in nodefile order, with free slots
+       spread: a slot of each host with free slots in turn
+    A preferred host can be requested, e.g. the host holding the files of a
+    replica; it is honored if it has free slots.
+    """
+
+    policies = ('random', 'pack', 'spread')
+
+    def __init__(self, hosts, policy='random'):
+        # hosts: host of each slot
+        self.policy = policy
+        self.host_of = list(hosts)
+        self.host_index = {}
+        for host in self.host_of:
+            self.host_index.setdefault(host, len(self.host_index))
+        self.free = slot_set()
+        self.host_free = dict((host, slot_set()) for host in self.host_index)
+        # hosts with free slots in order of preference, in a heap for
+        # 'pack' and in round-robin order for 'spread'. Hosts that ran out of
+        # free slots are dropped lazily.
+        self.heap = []
+        self.ring = collections.deque()
+        self.queued = set()
+        for slot in range(len(self.host_of)):
+            self.release(slot)
+
+    def __len__(self):
+        return len(self.free)
+
+    def _enqueue(self, host):
+        if host in self.queued:
+            return
+        self.queued.add(host)
+        if self.policy == 'pack':
+            heapq.heappush(self.heap, (self.host_index[host], host))
+        else:
+            self.ring.append(host)
+
+    def _nextHost(self):
+        # next host with free slots according to the policy
+        while True:
+            if self.policy == 'pack':
+                host = self.heap[0][1]
+            else:
+                host = self.ring[0]
+            if len(self.host_free[host]) > 0:
+                if self.policy == 'spread':
+                    self.ring.rotate(-1)
+                return host
+            if self.policy == 'pack':
+                heapq.heappop(self.heap)
+            else:
+                self.ring.popleft()
+            self.queued.discard(host)
+
+    def acquire(self, host=None):
+        """
+        Removes a free slot from the pool and returns it, None if no slot is
+        free.
+        """
+        if len(self.free) == 0:
+            return None
+        if host is not None and host in self.host_free and len(self.host_free[host]) > 0:
+            slot = self.host_free[host].choice()
+        elif self.policy == 'random':
+            slot = self.free.choice()
+        else:
+            slot = self.host_free[self._nextHost()].choice()
+        self.free.remove(slot)
+        self.host_free[self.host_of[slot]].remove(slot)
+        return slot
+
+    def release(self, slot):
+        """
+        Returns a slot to the pool.
+        """
+        host = self.host_of[slot]
+        self.free.add(slot)
+        self.host_free[host].add(slot)
+        if self.policy != 'random':
+            self._enqueue(host)
+
+
 class ssh_transport(Transport):
     """
     Class to launch and monitor jobs on a set of nodes via ssh (paramiko)
     """
 
-    def __init__(self, jobname, compute_nodes, replicas):  # changed on 12/1/14
+    # md5 of the files in a tar stream retrieved from a remote node
+    _manifest = ".asyncre_manifest"
+
+    def __init__(self, jobname, compute_nodes, replicas, keywords=None):  # changed on 12/1/14
         # jobname: identifies current asyncRE job
         # compute_nodes: list of names of nodes in the pool
         # nreplicas: number of replicas, 0 ... nreplicas-1
+        # keywords: optional settings from the control file
         Transport.__init__(self)  # WFF - 2/18/15
         self.logger = logging.getLogger("async_re.ssh_transport")  # WFF - 3/2/15
 
+        self.jobname = jobname
+
         # names of compute nodes (slots)
         self.compute_nodes = compute_nodes  # changed on 12/1/14
         self.nprocs = len(self.compute_nodes)
@@ -48,6 +245,76 @@ class ssh_transport(Transport):
         # to launch
         self.jobqueue = Queue.Queue()
 
+        # pool of idle SSH connections keyed by (node name, user name),
+        # reused across jobs to avoid a new handshake for each job
+        self.ssh_pool = {}
+        self.ssh_pool_lock = threading.Lock()
+
+        # threads running the remote job sessions, at most one job per slot
+        # is in flight. Sessions report on the completed queue as they end,
+        # session_replica maps their futures back to replicas. With more
+        # slots than SSH_THREADS threads, sessions wait for a free thread.
+        nthreads = min(self.nprocs, 64)
+        if keywords is not None and keywords.get('SSH_THREADS') is not None:
+            try:
+                nthreads = int(keywords.get('SSH_THREADS'))
+            except ValueError:
+                nthreads = 0
+            if nthreads < 1:
+                self.logger.warning("Invalid SSH_THREADS %s, using %d threads",
+                                    keywords.get('SSH_THREADS'), min(self.nprocs, 64))
+                nthreads = min(self.nprocs, 64)
+        self.completed = Queue.Queue()
+        self.session_replica = {}
+        self.executor = job_executor(nthreads, self.completed)
+
+        # binaries, libraries and static input files are staged once per
+        # node in a staging area named after their content hash and linked
+        # into the remote replica directories, see _stageFiles()
+        #   exec_files: lists of files in the lib and bin directories, keyed
+        #               by (exec directory, architecture)
+        #   file_hashes: md5 of local files keyed by path, along with the
+        #                size and modification time they were computed for
+        #   replica_files: paths of the input and output files of the last
+        #                  job of each replica, whose hashes are dropped when
+        #                  the replica moves on to the next cycle
+        #   staged: hashes of files present in each staging area, keyed by
+        #           (node name, user name, staging directory)
+        self.exec_files = {}
+        self.file_hashes = {}
+        self.replica_files = [set() for k in replicas]
+        self.staged = {}
+        self.staging_locks = {}
+        self.staging_lock = threading.Lock()
+
+        # sticky placement: a replica preferably runs on the node that ran
+        # its last cycle. Its restart files stay there in a persistent remote
+        # replica directory and are sent again only if the replica migrates
+        # or if the local copy has changed.
+        #   replica_home: (node name, user name, tmp folder) of the remote
+        #                 directory of each replica
+        #   replica_resident: md5 of the restart files in the remote
+        #                     directory of each replica
+        self.sticky = False
+        if keywords is not None and keywords.get('SSH_STICKY_PLACEMENT') is not None:
+            self.sticky = (keywords.get('SSH_STICKY_PLACEMENT').lower() == 'yes')
+        self.replica_home = [None for k in replicas]
+        self.replica_resident = [dict() for k in replicas]
+
+        # free slots and how jobs are placed on them
+        policy = 'random'
+        if keywords is not None and keywords.get('SSH_PLACEMENT') is not None:
+            policy = keywords.get('SSH_PLACEMENT').lower()
+            if policy not in slot_pool.policies:
+                self.logger.warning("Unknown SSH_PLACEMENT %s, using random placement", policy)
+                policy = 'random'
+        self.slots = slot_pool([self._nodeHost(node) for node in range(self.nprocs)], policy)
+
+        # gzip the tar streams carrying job input and output files
+        self.compression = False
+        if keywords is not None and keywords.get('SSH_COMPRESSION') is not None:
+            self.compression = (keywords.get('SSH_COMPRESSION').lower() == 'yes')
+
     def _clear_resource(self, replica):
         # frees up the node running a replica identified by replica id
         job = None
@@ -67,21 +334,46 @@ class ssh_transport(Transport):
             return None
 
         try:
-            self.node_status[nodeid] = None
+            if self.node_status[nodeid] != None:
+                self.node_status[nodeid] = None
+                self.slots.release(nodeid)
         except:
             self.logger.warning("clear_resource(): unknown nodeid %", nodeid)
             return None
 
         return nodeid
 
-    def _availableNode(self):
-        # returns a node at random among available nodes
-        available = [node for node in range(self.nprocs)
-                     if self.node_status[node] == None]
-        if available == None or len(available) == 0:
-            return None
-        random.shuffle(available)
-        return available[0]
+    def _nodeHost(self, node):
+        # identifies the host and tmp folder of a node (slot)
+        return (self.compute_nodes[node]["node_name"],
+                self.compute_nodes[node]["user_name"],
+                self.compute_nodes[node]["tmp_folder"])
+
+    def _collectCompleted(self, timeout):
+        # waits up to timeout seconds for a remote session to end, then
+        # collects all of the ended sessions freeing their nodes. Returns the
+        # number of replicas found done.
+        futures = []
+        try:
+            futures.append(self.completed.get(timeout=timeout))
+        except Queue.Empty:
+            return 0
+        while True:
+            try:
+                futures.append(self.completed.get_nowait())
+            except Queue.Empty:
+                break
+        ncompleted = 0
+        for future in futures:
+            replica = self.session_replica.pop(future, None)
+            if replica == None:
+                continue
+            job = self.replica_to_job[replica]
+            # skip sessions already collected through isDone()
+            if job != None and job['process_handle'] is future:
+                self.isDone(replica, 0)
+                ncompleted += 1
+        return ncompleted
 
     # utility to repeat a scp put command
     def _RepeatSCPput(self, transport, local_file, remote_file, num_tries=10, sleep_time=10):
@@ -105,117 +397,447 @@ class ssh_transport(Transport):
                 transport.put(local_file, remote_file)
                 break
 
-    # utility to repeat a scp get command
-    def _RepeatSCPget(self, transport, remote_file, local_file, num_tries=10, sleep_time=10):
-        ntries = 0
-        # self.logger.info("scp %s %s", remote_file, local_file) #can print out here to check the scp
-        while True:
-            # retry a number of times
-            if ntries < num_tries:
-                try:
-                    transport.get(remote_file, local_file)
-                except:
-                    self.logger.info("Warning: unable to copy back file %s. Retrying ..." % local_file)
-                    time.sleep(sleep_time)  # waits few seconds and try again
-                    ntries += 1
-                    continue
-                else:
-                    # success
-                    break
-            else:
-                # retry one last time, letting it fail in case
-                transport.get(remote_file, local_file)
-                break
+    def _openSSHconnection(self, job):
+        ssh = paramiko.SSHClient()
+        ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+        if job['username'] != None:
+            ssh.connect(job['nodename'], username=job['username'])
+        else:
+            ssh.connect(job['nodename'])
+        self.logger.info("SSH connection established to %s", job['nodename'])
+        return ssh
 
-    def _checkSSHconnection(self, ssh, scpt, job):
+    def _checkSSHconnection(self, ssh, job):
         # try to reopen ssh connection if it has closed
         try:
             transport = ssh.get_transport()
+            if transport == None or not transport.is_active():
+                raise paramiko.SSHException("SSH connection is closed")
             transport.send_ignore()
         except:
             # connection is probably closed, try to reconnect
             ssh.close()
-            ssh = paramiko.SSHClient()
-            ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-            if job['username'] != None:
-                ssh.connect(job['nodename'], username=job['username'])
-            else:
-                ssh.connect(job['nodename'])
-            scpt = scp.SCPClient(ssh.get_transport())
+            ssh = self._openSSHconnection(job)
             self.logger.info("Restablished SSH connection to %s", job['nodename'])
-        return (ssh, scpt)
+        return ssh
+
+    def _acquireSSHconnection(self, job):
+        # returns an idle connection to the job's node from the pool, checking
+        # that it is still alive, or opens a new one
+        key = (job['nodename'], job['username'])
+        ssh = None
+        with self.ssh_pool_lock:
+            idle = self.ssh_pool.get(key)
+            if idle:
+                ssh = idle.pop()
+        if ssh == None:
+            return self._openSSHconnection(job)
+        return self._checkSSHconnection(ssh, job)
+
+    def _releaseSSHconnection(self, job, ssh):
+        # returns a connection to the pool for reuse by later jobs
+        key = (job['nodename'], job['username'])
+        with self.ssh_pool_lock:
+            self.ssh_pool.setdefault(key, []).append(ssh)
+
+    def _execRemote(self, ssh, command):
+        # runs a command on the remote node, returns its exit status, stdout
+        # and stderr
+        stdin, stdout, stderr = ssh.exec_command(command)
+        output = stdout.read()
+        error = stderr.read()
+        status = stdout.channel.recv_exit_status()
+        stdin.close()
+        stdout.close()
+        stderr.close()
+        return (status, output, error)
+
+    def _execRemoteStreamed(self, ssh, command, output_file, error_file, chunksize=32768):
+        # runs a command on the remote node streaming its stdout and stderr
+        # in chunks into local files, returns its exit status and the number
+        # of bytes written to each file
+        channel = ssh.get_transport().open_session()
+        channel.exec_command(command)
+        output = open(output_file, 'wb')
+        error = open(error_file, 'wb')
+        noutput = 0
+        nerror = 0
+        while True:
+            select.select([channel], [], [], 1.0)
+            while channel.recv_ready():
+                data = channel.recv(chunksize)
+                output.write(data)
+                noutput += len(data)
+            while channel.recv_stderr_ready():
+                data = channel.recv_stderr(chunksize)
+                error.write(data)
+                nerror += len(data)
+            if channel.exit_status_ready() and not (channel.recv_ready() or channel.recv_stderr_ready()):
+                break
+        status = channel.recv_exit_status()
+        output.close()
+        error.close()
+        channel.close()
+        return (status, noutput, nerror)
+
+    def _sessionFiles(self, job):
+        # local files receiving the stdout and stderr of the remote session
+        # of a job, one pair per replica and cycle
+        prefix = job["working_directory"] + "/" + os.path.splitext(job["output_file"])[0]
+        return (prefix + ".ssh_out", prefix + ".ssh_err")
+
+    def _fileHash(self, filename):
+        # md5 of the contents of a local file, recomputed only if the file
+        # has changed
+        st = os.stat(filename)
+        with self.staging_lock:
+            entry = self.file_hashes.get(filename)
+        if entry != None and entry[0] == st.st_size and entry[1] == st.st_mtime:
+            return entry[2]
+        md5 = hashlib.md5()
+        f = open(filename, 'rb')
+        chunk = f.read(1 << 20)
+        while chunk:
+            md5.update(chunk)
+            chunk = f.read(1 << 20)
+        f.close()
+        with self.staging_lock:
+            self.file_hashes[filename] = (st.st_size, st.st_mtime, md5.hexdigest())
+        return md5.hexdigest()
+
+    def _tarMode(self, mode):
+        # tarfile stream mode ('r' or 'w') and matching tar command flag
+        if self.compression:
+            return (mode + "|gz", "z")
+        return (mode + "|", "")
+
+    def _readManifest(self, text):
+        # parses md5sum output into a dictionary of md5 keyed by file name
+        manifest = {}
+        for line in text.splitlines():
+            words = line.split()
+            if len(words) == 2:
+                manifest[words[1]] = words[0]
+        return manifest
+
+    def _extractFile(self, tar, member, local_file):
+        # unpacks a member of a tar stream into local_file, returns its md5
+        md5 = hashlib.md5()
+        source = tar.extractfile(member)
+        f = open(local_file, 'wb')
+        chunk = source.read(1 << 20)
+        while chunk:
+            md5.update(chunk)
+            f.write(chunk)
+            chunk = source.read(1 << 20)
+        f.close()
+        st = os.stat(local_file)
+        with self.staging_lock:
+            self.file_hashes[local_file] = (st.st_size, st.st_mtime, md5.hexdigest())
+        return md5.hexdigest()
+
+    def _putFiles(self, ssh, job, files, num_tries=10, sleep_time=10):
+        """
+        Sends files from the local to the remote working directory of a job
+        as a single tar stream over one SSH channel. The remote side replies
+        with the md5 of the files it unpacked; those that do not match the
+        local copies are sent again.
+        """
+        (mode, flag) = self._tarMode('w')
+        remote_working_directory = job["remote_working_directory"]
+        pending = list(files)
+        ntries = 0
+        while pending:
+            command = "mkdir -p %s && cd %s && tar x%sf - && md5sum %s" % (
+                remote_working_directory, remote_working_directory, flag, " ".join(pending))
+            manifest = {}
+            try:
+                stdin, stdout, stderr = ssh.exec_command(command)
+                tar = tarfile.open(fileobj=stdin, mode=mode)
+                for filename in pending:
+                    tar.add(job["working_directory"] + "/" + filename, arcname=filename)
+                tar.close()
+                stdin.channel.shutdown_write()
+                manifest = self._readManifest(stdout.read())
+                stdout.channel.recv_exit_status()
+                stdin.close()
+                stdout.close()
+                stderr.close()
+            except:
+                pass
+            pending = [filename for filename in pending
+                       if manifest.get(filename) != self._fileHash(job["working_directory"] + "/" + filename)]
+            if pending:
+                ntries += 1
+                if ntries > num_tries:
+                    raise IOError("unable to transfer files %s to %s" % (" ".join(pending), job['nodename']))
+                self.logger.info("Warning: unable to transfer files %s. Retrying ..." % " ".join(pending))
+                time.sleep(sleep_time)  # waits few seconds and try again
+
+    def _getFiles(self, ssh, job, files, num_tries=10, sleep_time=10):
+        """
+        Retrieves files from the remote working directory of a job as a single
+        tar stream over one SSH channel. The stream starts with a manifest of
+        the md5 of the files found on the remote side; each file is checked
+        against it as it is unpacked and those that do not match are
+        retrieved again. Files not found on the remote side (e.g. the job
+        failed) are skipped, the file checker will discover them.
+
+        Returns a dictionary with the md5 of the files retrieved.
+        """
+        (mode, flag) = self._tarMode('r')
+        remote_working_directory = job["remote_working_directory"]
+        fetched = {}
+        pending = list(files)
+        ntries = 0
+        while pending:
+            command = "cd %s && md5sum %s > %s 2> /dev/null ; tar c%sf - %s $(awk '{print $2}' %s)" % (
+                remote_working_directory, " ".join(pending), self._manifest,
+                flag, self._manifest, self._manifest)
+            manifest = None
+            try:
+                stdin, stdout, stderr = ssh.exec_command(command)
+                tar = tarfile.open(fileobj=stdout, mode=mode)
+                for member in tar:
+                    if member.name == self._manifest:
+                        manifest = self._readManifest(tar.extractfile(member).read())
+                    elif manifest != None and member.name in manifest and member.isfile():
+                        local_file = job["working_directory"] + "/" + member.name
+                        md5 = self._extractFile(tar, member, local_file)
+                        if md5 == manifest[member.name]:
+                            fetched[member.name] = md5
+                tar.close()
+                stdout.channel.recv_exit_status()
+                stdin.close()
+                stdout.close()
+                stderr.close()
+            except:
+                pass
+            if manifest != None:
+                for filename in pending:
+                    if filename not in manifest:
+                        self.logger.warning("Remote file %s:%s/%s not found", job['nodename'],
+                                            remote_working_directory, filename)
+                pending = [filename for filename in pending
+                           if filename in manifest and filename not in fetched]
+            if pending:
+                ntries += 1
+                if ntries > num_tries:
+                    raise IOError("unable to copy back files %s from %s" % (" ".join(pending), job['nodename']))
+                self.logger.info("Warning: unable to copy back files %s. Retrying ..." % " ".join(pending))
+                time.sleep(sleep_time)  # waits few seconds and try again
+        return fetched
+
+    def _stagedFiles(self, ssh, stage_directory):
+        # names of the files of a staging area whose contents match the
+        # content hash in their name; files left truncated by an interrupted
+        # transfer are not counted as staged
+        (status, output, error) = self._execRemote(
+            ssh, "mkdir -p %s && cd %s && md5sum -- *_* 2> /dev/null" % (stage_directory, stage_directory))
+        manifest = self._readManifest(output)
+        return set(name for name in manifest if name.split("_", 1)[0] == manifest[name])
+
+    def _stageFile(self, sftp, local_file, staged_file):
+        # sends a file under a temporary name and renames it to its staged
+        # name once complete, so that a staged file is never partial
+        partial_file = "%s.part%d" % (staged_file, os.getpid())
+        try:
+            self._RepeatSCPput(sftp, local_file, partial_file)
+            sftp.chmod(partial_file, 0755)
+            sftp.posix_rename(partial_file, staged_file)
+        except:
+            try:
+                sftp.remove(partial_file)
+            except:
+                pass
+            raise
+
+    def _linkStagedFiles(self, ssh, job, links):
+        # links staged files into the remote working directory of a job,
+        # returns the names of those missing from the staging area
+        commands = []
+        for name in sorted(links):
+            staged_file = links[name][2]
+            commands.append("if [ -f %s ]; then ln -sf %s %s/%s; else echo %s; fi" % (
+                staged_file, staged_file, job["remote_working_directory"], name, name))
+        (status, output, error) = self._execRemote(ssh, " ; ".join(commands))
+        return output.split()
+
+    def _stageFiles(self, ssh, sftp, job, files):
+        """
+        Makes the given local files available in the remote working
+        directory of a job as symbolic links into the staging area of the
+        node. Files are sent to the node only if a file with the same content
+        hash is not already staged there. The contents of the staging area
+        are checked the first time it is used in a run; a staged file found
+        missing when linking (e.g. /tmp was cleaned) is sent again.
+        """
+        stage_directory = job["stage_directory"]
+        key = (job['nodename'], job['username'], stage_directory)
+        with self.staging_lock:
+            if key not in self.staging_locks:
+                self.staging_locks[key] = threading.Lock()
+            node_lock = self.staging_locks[key]
+
+        with node_lock:
+            staged = self.staged.get(key)
+            if staged == None:
+                # first contact with this staging area in this run, collect
+                # what was staged by earlier runs
+                staged = self._stagedFiles(ssh, stage_directory)
+                self.staged[key] = staged
+            pending = list(files)
+            for attempt in range(2):
+                links = {}
+                for filename in pending:
+                    name = os.path.basename(filename)
+                    staged_name = self._fileHash(filename) + "_" + name
+                    staged_file = stage_directory + "/" + staged_name
+                    if staged_name not in staged:
+                        self._stageFile(sftp, filename, staged_file)
+                        staged.add(staged_name)
+                    links[name] = (filename, staged_name, staged_file)
+                if not links:
+                    return
+                missing = self._linkStagedFiles(ssh, job, links)
+                if not missing:
+                    return
+                self.logger.warning("Staged files %s missing on %s, staging them again",
+                                    " ".join(missing), job['nodename'])
+                self._execRemote(ssh, "mkdir -p %s" % stage_directory)
+                for name in missing:
+                    staged.discard(links[name][1])
+                pending = [links[name][0] for name in missing]
+        raise IOError("unable to stage files %s on %s" % (" ".join(missing), job['nodename']))
+
+    def _keepRestartFiles(self, ssh, job, old_home, fetched):
+        """
+        Sticky placement: clears everything but the restart files produced by
+        a job from the remote replica directory. The restart files then serve
+        as inputs of the next cycle if the replica runs again on the same
+        node. fetched holds the md5 of the files retrieved and verified by
+        _getFiles().
+        """
+        replica = job['replica']
+        remote_working_directory = job["remote_working_directory"]
+        home = self._nodeHost(job['nodeid'])
+
+        resident = {}
+        for filename in job.get("job_restart_outputs") or []:
+            if filename in fetched:
+                resident[filename] = fetched[filename]
+
+        keep = set(resident.keys())
+        remove = [filename for filename in job["job_input_files"] + job["job_output_files"]
+                  if filename not in keep and filename not in (job.get("job_static_files") or [])]
+        remove.append(self._manifest)
+        if remove:
+            rm_command = "cd %s ; rm -f %s" % (remote_working_directory, " ".join(remove))
+            self._execRemote(ssh, rm_command)
+
+        self.replica_resident[replica] = resident
+        self.replica_home[replica] = home
+
+        if old_home != None and old_home != home:
+            # the replica has migrated, drop its directory on the old node
+            old_job = {'nodename': old_home[0], 'username': old_home[1]}
+            old_ssh = None
+            try:
+                old_ssh = self._acquireSSHconnection(old_job)
+                self._execRemote(old_ssh, "rm -rf %s/%s_r%d" % (old_home[2], self.jobname, replica))
+            except Exception as e:
+                # the outputs of the job are safe, leave the old directory
+                self.logger.warning("Unable to clean up r%d on %s: %s", replica, old_home[0], e)
+                if old_ssh != None:
+                    old_ssh.close()
+            else:
+                self._releaseSSHconnection(old_job, old_ssh)
 
     def _launchCmd(self, command, job):
-        ssh = paramiko.SSHClient()
-        ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+        ssh = self._acquireSSHconnection(job)
+        old_home = self.replica_home[job['replica']]
+        try:
+            result = self._runSession(ssh, command, job, old_home)
+        except:
+            # the connection may be broken, close it rather than returning
+            # it to the pool, and clean up the remote directory of the job
+            ssh.close()
+            self._cleanupFailedJob(job)
+            raise
+        self._releaseSSHconnection(job, ssh)
+        return result
 
-        if job['username'] != None:
-            ssh.connect(job['nodename'], username=job['username'])
-        else:
-            ssh.connect(job['nodename'])
+    def _cleanupFailedJob(self, job):
+        # removes the remote working directory of a job whose session failed,
+        # over a new connection
+        if not job["remote_working_directory"]:
+            return
+        if self.replica_home[job['replica']] == self._nodeHost(job['nodeid']):
+            # the restart files of the replica were in that directory
+            self.replica_home[job['replica']] = None
+            self.replica_resident[job['replica']] = {}
+        try:
+            ssh = self._openSSHconnection(job)
+            try:
+                self._execRemote(ssh, "rm -rf %s" % job['remote_working_directory'])
+            finally:
+                ssh.close()
+        except Exception as e:
+            self.logger.warning("Unable to clean up %s:%s: %s", job['nodename'],
+                                job['remote_working_directory'], e)
 
-        self.logger.info("SSH connection established to %s", job['nodename'])
+    def _runSession(self, ssh, command, job, old_home):
+        # sends the input files of a job, runs it and retrieves its output
+        # files over an SSH connection
+
+        # restart files already in the remote replica directory
+        resident = {}
+        if self.sticky and old_home == self._nodeHost(job['nodeid']):
+            resident = self.replica_resident[job['replica']]
 
         if job["remote_working_directory"]:
             mkdir_command = "mkdir -p %s" % job['remote_working_directory']
-            stdin, stdout, stderr = ssh.exec_command(mkdir_command)
-            output = stdout.read()
-            error = stderr.read()
-            stdin.close()
-            stdout.close()
-            stderr.close()
-
-            send_files_command = "scp "
-            for filename in job["exec_files"]:
-                send_files_command += filename + " "
+            self._execRemote(ssh, mkdir_command)
+
+            sftp = ssh.open_sftp()
+            # binaries, libraries and static input files go through the
+            # staging area, the other input files are sent every time
+            static_files = job.get("job_static_files") or []
+            staged_files = list(job["exec_files"])
+            for filename in static_files:
+                staged_files.append(job["working_directory"] + "/" + filename)
+            try:
+                self._stageFiles(ssh, sftp, job, staged_files)
+            finally:
+                sftp.close()
+            input_files = []
             for filename in job["job_input_files"]:
-                send_files_command += job["working_directory"] + "/" + filename + " "
-            if job['username'] != None:
-                send_files_command += job['username'] + "@"
-            send_files_command += job['nodename'] + ":" + job["remote_working_directory"] + "/"
-            subprocess.call(send_files_command + " > /dev/null 2>&1 ", shell=True)
+                if filename in static_files:
+                    continue
+                local_file = job["working_directory"] + "/" + filename
+                if filename in resident and resident[filename] == self._fileHash(local_file):
+                    # left by the previous cycle of the replica on this node
+                    continue
+                input_files.append(filename)
+            self._putFiles(ssh, job, input_files)
 
             chmod_command = "chmod -R 777 %s" % job['remote_working_directory']
-            stdin, stdout, stderr = ssh.exec_command(chmod_command)
-            output = stdout.read()
-            error = stderr.read()
-            stdin.close()
-            stdout.close()
-            stderr.close()
-            
+            self._execRemote(ssh, chmod_command)
 
-        stdin, stdout, stderr = ssh.exec_command(command)
-        output = stdout.read()
-        error = stderr.read()
-        stdin.close()
-        stdout.close()
-        stderr.close()
+        (output_file, error_file) = self._sessionFiles(job)
+        (status, noutput, nerror) = self._execRemoteStreamed(ssh, command, output_file, error_file)
 
         if job["remote_working_directory"]:
-            get_files_command = "scp "
-            if job['username'] != None:
-                get_files_command += job['username'] + "@"
-            get_files_command += job['nodename'] + ":" + job["remote_working_directory"] + "/"
-            files = "{"
-            for n in range(0, len(job["job_output_files"])):
-                filename = job["job_output_files"][n]
-                if n == 0:
-                    files += filename
-                else:
-                    files += "," + filename
-            files += "}"
-            get_files_command += files + " " + job["working_directory"] + "/"
-            subprocess.call(get_files_command + " > /dev/null 2>&1 ", shell=True)
-            rmdir_command = "rm -rf %s" % job['remote_working_directory']
-            stdin, stdout, stderr = ssh.exec_command(rmdir_command)
-            stdin.close()
-            stdout.close()
-            stderr.close()
-
-        job['output_queue'].put(output)
-        job['error_queue'].put(error)
+            fetched = self._getFiles(ssh, job, job["job_output_files"])
+            if self.sticky:
+                self._keepRestartFiles(ssh, job, old_home, fetched)
+            else:
+                rmdir_command = "rm -rf %s" % job['remote_working_directory']
+                self._execRemote(ssh, rmdir_command)
 
-        ssh.close()
+        return {'exit_status': status,
+                'output_file': output_file, 'output_bytes': noutput,
+                'error_file': error_file, 'error_bytes': nerror}
 
     def launchJob(self, replica, job_info):
         """
@@ -229,22 +851,31 @@ class ssh_transport(Transport):
         command = "%s %s > %s 2> %s " % (executable, input_file, output_file, error_file)
         
 
-        output_queue = mp.Queue()
-        error_queue = mp.Queue()
-
         job = job_info
         job['replica'] = replica
-        job['output_queue'] = output_queue
-        job['error_queue'] = error_queue
         job['command'] = command
         job['process_handle'] = None
 
         self.replica_to_job[replica] = job
+        self._evictFileHashes(replica, job)
 
         self.jobqueue.put(replica)
 
         return self.jobqueue.qsize()
 
+    def _evictFileHashes(self, replica, job):
+        # drops the hashes of the files of the previous cycle of a replica
+        # that are not used by its new job (restart files produced by the
+        # previous cycle are inputs of the new one), so that file_hashes
+        # holds at most one cycle of files per replica
+        files = set()
+        for filename in (job.get("job_input_files") or []) + (job.get("job_output_files") or []):
+            files.add(job["working_directory"] + "/" + filename)
+        with self.staging_lock:
+            for filename in self.replica_files[replica] - files:
+                self.file_hashes.pop(filename, None)
+        self.replica_files[replica] = files
+
     # intel coprocessor setup
     def ModifyCommand(self, job, command):
         nodename = job['nodename']
@@ -275,27 +906,34 @@ class ssh_transport(Transport):
         # self.logger.info(new_command) #can print new_command here to check the command
         return new_command
 
-    def ProcessJobQueue(self, mintime, maxtime):
+    def ProcessJobQueue(self, mintime, maxtime, return_on_completion=False):
         """
         Launches jobs waiting in the queue.
         It will scan free nodes and job queue up to maxtime.
-        If the queue becomes empty, it will still block until maxtime is elapsed.
+        If the queue becomes empty, it will still block until maxtime is elapsed,
+        unless return_on_completion is set, in which case it returns as soon as
+        a running job has completed.
         """
         njobs_launched = 0
+        ncompleted = 0
+        start_time = time.time()
         usetime = 0
-        nreplicas = len(self.replica_to_job)
 
         while usetime < maxtime:
 
-            # find an available node
-            node = self._availableNode()
-
-            while (not self.jobqueue.empty()) and (not node == None):
+            while (not self.jobqueue.empty()) and len(self.slots) > 0:
 
                 # grabs job on top of the queue
                 replica = self.jobqueue.get()
                 job = self.replica_to_job[replica]
 
+                # find an available node, preferably the one holding the
+                # replica's restart files
+                host = None
+                if self.sticky:
+                    host = self.replica_home[replica]
+                node = self.slots.acquire(host)
+
                 # assign job to available node
                 job['nodeid'] = node
                 job['nodename'] = self.compute_nodes[node]["node_name"]
@@ -308,6 +946,12 @@ class ssh_transport(Transport):
                 # retrieve remote working directory of node
                 job["remote_working_directory"] = self.compute_nodes[node]["tmp_folder"] + "/" + job[
                     "remote_replica_dir"]
+                if self.sticky:
+                    # persistent remote directory of the replica
+                    job["remote_working_directory"] = "%s/%s_r%d" % (
+                        self.compute_nodes[node]["tmp_folder"], self.jobname, replica)
+                # staging area for binaries and static files on the node
+                job["stage_directory"] = self.compute_nodes[node]["tmp_folder"] + "/" + self.jobname + "_stage"
 
                 command = self.ModifyCommand(job, command)
 
@@ -323,20 +967,21 @@ class ssh_transport(Transport):
                     architecture = ""
 
                 exec_directory = job["exec_directory"]
-                lib_directory = exec_directory + "/lib/" + architecture
-                bin_directory = exec_directory + "/bin/" + architecture
+                if (exec_directory, architecture) not in self.exec_files:
+                    lib_directory = exec_directory + "/lib/" + architecture
+                    bin_directory = exec_directory + "/bin/" + architecture
+                    exec_files = []
+                    for filename in os.listdir(lib_directory):
+                        exec_files.append(lib_directory + "/" + filename)
+                    for filename in os.listdir(bin_directory):
+                        exec_files.append(bin_directory + "/" + filename)
+                    self.exec_files[(exec_directory, architecture)] = exec_files
+                job["exec_files"] = self.exec_files[(exec_directory, architecture)]
 
-                job["exec_files"] = []
-                for filename in os.listdir(lib_directory):
-                    job["exec_files"].append(lib_directory + "/" + filename)
-                for filename in os.listdir(bin_directory):
-                    job["exec_files"].append(bin_directory + "/" + filename)
-
-                # launches job
-                processid = mp.Process(target=self._launchCmd, args=(command, job))
-                processid.start()
-
-                job['process_handle'] = processid
+                # launches job; the session runs in the thread pool and
+                # shares the pool of SSH connections
+                job['process_handle'] = self.executor.submit(self._launchCmd, command, job)
+                self.session_replica[job['process_handle']] = replica
 
                 # connects node to replica
                 self.replica_to_job[replica] = job
@@ -344,16 +989,15 @@ class ssh_transport(Transport):
 
                 # updates number of jobs launched
                 njobs_launched += 1
-                node = self._availableNode()
 
-            # waits mintime second and rescans job queue
-            time.sleep(mintime)
+            # waits up to mintime seconds for jobs to end and frees their
+            # nodes, then rescans job queue
+            ncompleted += self._collectCompleted(mintime)
 
-            # updates set of free nodes by checking for replicas that have exited
-            for repl in range(nreplicas):
-                self.isDone(repl, 0)
+            usetime = time.time() - start_time
 
-            usetime += mintime
+            if return_on_completion and ncompleted > 0:
+                break
 
         return njobs_launched
 
@@ -375,24 +1019,18 @@ class ssh_transport(Transport):
             if process == None:
                 done = False
             else:
-                done = not process.is_alive()
+                done = process.done()
             if done:
                 # disconnects replica from job and node
                 self._clear_resource(replica)
 
-                # attempt to remove item from queues
-                try:
-                    # wait 30sec, if not raise Queue.Empty exception
-                    # this could also be modified to use .get(block=False)
-                    # which is equivalent to timeout=0
-                    self.logger.info("%s", job['output_queue'].get(timeout=30))
-                    self.logger.info("%s", job['error_queue'].get(timeout=30))
-                # if the queues timeout, raises a Queue.Empty Exception
-                # note this is not a mp.Queue exception; it's from the Queue lib
-                except Queue.Empty:
-                    self.logger.warn("Error removing items from ssh process communication queues for r%s", replica)
-
-                job['output_queue'].close()
-                job['error_queue'].close()
+                if process.exception() != None:
+                    self.logger.warning("Remote session of r%s failed: %s", replica, process.exception())
+                else:
+                    result = process.result()
+                    self.logger.info("r%s exited with status %s, %d bytes of output in %s, %d bytes in %s",
+                                     replica, result['exit_status'],
+                                     result['output_bytes'], result['output_file'],
+                                     result['error_bytes'], result['error_file'])
                 self.replica_to_job[replica] = None
             return done
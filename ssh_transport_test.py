@@ -0,0 +1,94 @@
+"""
+Tests of the placement of jobs on the free slots of the SSH transport.
+
+   python ssh_transport_test.py
+"""
+import os
+import sys
+import unittest
+
+package_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, package_dir)
+from ssh_transport import slot_pool
+
+# host of each slot, as listed in the nodefile
+hosts = ['a', 'a', 'b', 'b', 'b', 'c']
+
+
+class slot_pool_test(unittest.TestCase):
+
+    def _acquire_all(self, pool):
+        slots = []
+        while True:
+            slot = pool.acquire()
+            if slot is None:
+                return slots
+            slots.append(slot)
+
+    def test_random(self):
+        pool = slot_pool(hosts)
+        self.assertEqual(len(pool), 6)
+        slots = self._acquire_all(pool)
+        self.assertEqual(sorted(slots), range(6))
+        self.assertEqual(len(pool), 0)
+
+        pool.release(3)
+        pool.release(0)
+        self.assertEqual(len(pool), 2)
+        self.assertEqual(sorted([pool.acquire(), pool.acquire()]), [0, 3])
+        self.assertEqual(pool.acquire(), None)
+
+    def test_pack(self):
+        pool = slot_pool(hosts, 'pack')
+        slots = self._acquire_all(pool)
+        self.assertEqual(sorted(slots), range(6))
+        # hosts are filled in nodefile order
+        self.assertEqual([hosts[slot] for slot in slots], hosts)
+
+        # released slots are handed out first host first, whatever the
+        # order of release
+        for slot in (5, 2, 1):
+            pool.release(slot)
+        self.assertEqual(self._acquire_all(pool), [1, 2, 5])
+
+        pool.release(4)
+        pool.release(0)
+        self.assertEqual(pool.acquire(), 0)
+        pool.release(3)
+        self.assertEqual(sorted(self._acquire_all(pool)), [3, 4])
+
+    def test_spread(self):
+        pool = slot_pool(hosts, 'spread')
+        slots = self._acquire_all(pool)
+        self.assertEqual(sorted(slots), range(6))
+        # one host after the other, skipping hosts with no free slots
+        self.assertEqual([hosts[slot] for slot in slots], ['a', 'b', 'c', 'a', 'b', 'b'])
+
+        # the last host served keeps its place in the rotation, the others
+        # rejoin it in order of release
+        for slot in (5, 0, 2, 1):
+            pool.release(slot)
+        self.assertEqual([hosts[slot] for slot in self._acquire_all(pool)], ['b', 'c', 'a', 'a'])
+
+    def test_preferred_host(self):
+        for policy in slot_pool.policies:
+            pool = slot_pool(hosts, policy)
+            self.assertEqual(pool.acquire('c'), 5)
+            # no free slot left on the preferred host, or an unknown host
+            slot = pool.acquire('c')
+            self.assertTrue(slot is not None and hosts[slot] != 'c')
+            slot = pool.acquire('z')
+            self.assertTrue(slot is not None and hosts[slot] != 'c')
+            self.assertEqual(len(pool), 3)
+
+            pool.release(5)
+            self.assertEqual(pool.acquire('c'), 5)
+            self.assertTrue(hosts[pool.acquire('b')] == 'b')
+
+        pool = slot_pool(hosts, 'pack')
+        self.assertEqual(hosts[pool.acquire('b')], 'b')
+        self.assertEqual([hosts[slot] for slot in self._acquire_all(pool)], ['a', 'a', 'b', 'b', 'c'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,15 +1,17 @@
-import os
 import sys
-import re
 import time
 import math
 import random
 import logging
+from numpy import outer, asarray
 from async_re import async_re
 from impact_async_re import impact_job
 
 class tempt_async_re_job(impact_job):
 
+    # with T-RE there are only 2 lines of data printed in the output file
+    _impact_data_lines = 2
+
     def _setLogger(self):
         self.logger = logging.getLogger('async_re.tempt_async_re')
 
@@ -60,21 +62,13 @@ class tempt_async_re_job(impact_job):
         inpfile = "r%d/%s_%d.inp" % (replica, basename, cycle)
 
         temperature = self.stateparams[stateid]['temperature']
-        # read template buffer
-        tfile = self._openfile(template, "r")
-        tbuffer = tfile.read()
-        tfile.close()
-        # make modifications
-        tbuffer = tbuffer.replace("@n@",str(cycle))
-        tbuffer = tbuffer.replace("@nm1@",str(cycle-1))
-        tbuffer = tbuffer.replace("@temperature@",temperature)
-        tbuffer = tbuffer.replace("@jobname@",basename)
-        tbuffer = tbuffer.replace("@replica@",str(replica))
-        tbuffer = tbuffer.replace("@cycle@",str(cycle))
-        # write out
-        ofile = self._openfile(inpfile, "w")
-        ofile.write(tbuffer)
-        ofile.close()
+        # fill in template and write out
+        self._writeInpFile(template, inpfile, {"n": str(cycle),
+                                               "nm1": str(cycle-1),
+                                               "temperature": temperature,
+                                               "jobname": basename,
+                                               "replica": str(replica),
+                                               "cycle": str(cycle)})
 
         # update the history status file
         ofile = self._openfile("r%d/state.history" % replica, "a")
@@ -138,62 +132,16 @@ class tempt_async_re_job(impact_job):
             if self.keywords.get('VERBOSE') == "yes":
                 self.logger.info("Accepted %f %f", math.exp(-delta), csi)
 
-    def _getImpactData(self, file):
-        """
-        Override because with T-RE there are only 2 lines of data printed in the
-        output file.
-
-        Reads all of the Impact simulation data values temperature, energies,
-        etc.  at each time step and puts into a big table
-        """
-        if not os.path.exists(file):
-            msg = 'File does not exist: %s' % file
-            self._exit(msg)
-        step_line = re.compile("^ Step number:")
-        number_line = re.compile("(\s+-*\d\.\d+E[\+-]\d+\s*)+")
-        nsamples = 0
-        data = []
-        f = self._openfile(file ,"r")
-        line = f.readline()
-        while line:
-            # fast forward until we get to the line:
-            # "Step number: ... "
-            while line and not re.match(step_line, line):
-                line = f.readline()
-            # read the step number
-            if re.match(step_line, line):
-                words = line.split()
-                step = words[2]
-                #now read up to 2 lines of numbers
-                datablock = [int(step)]
-                ln = 0
-                while ln < 2:
-                    line = f.readline()
-                    if not line:
-                        msg = "Unexpected end of file"
-                        self._exit(msg)
-                    if re.match(number_line, line):
-                        for word in line.split():
-                            datablock.append(float(word))
-                        ln += 1
-                data.append(datablock)
-            line = f.readline()
-        f.close()
-        return data
-
     def _extractLast_TotalEnergy(self,repl,cycle):
         """
         Extracts binding energy from Impact output
         """
-        output_file = "r%s/%s_%d.out" % (repl,self.basename,cycle)
-        datai = self._getImpactData(output_file)
-        nf = len(datai[0])
-        nr = len(datai)
-        # [nr-1]: last record
+        # last record
+        datai = self._getLastRecord(repl,cycle)
         #    [2]: total energy item (0 is step number and 1 is temperature)
         #
         # (total energy)
-        return datai[nr-1][2]
+        return datai[2]
 
     def print_status(self):
         """
@@ -234,6 +182,13 @@ class tempt_async_re_job(impact_job):
         e0 = pot[0]
         return beta*e0
 
+    def _reduced_energy_block(self,par,pot):
+        # par: [beta] of the states
+        # pot: [e0] of the replicas
+        par = asarray(par,dtype=float)
+        pot = asarray(pot,dtype=float)
+        return outer(par[:,0],pot[:,0])
+
 if __name__ == '__main__':
 
     # Parse arguments:
@@ -13,6 +13,7 @@ functionality, they will inherit an empty method
 """
 
 import os
+import time
 import logging, logging.config
 
 class Transport(object):
@@ -24,3 +25,43 @@ class Transport(object):
     def poll(self):
         return
 
+    def launchJobs(self, batch):
+        """
+        Submits a batch of jobs, a list of (replica, job_info) pairs, and
+        returns the list of what launchJob() returns for each of them (None
+        if the job could not be submitted).
+
+        This default submits the jobs one at a time; transports that can
+        submit many jobs in one call (one Condor submit file with many
+        procs, one BOINC work creation pass) override it.
+        """
+        return [self.launchJob(replica, job_info) for (replica, job_info) in batch]
+
+    def ProcessJobQueue(self, mintime, maxtime, return_on_completion=False):
+        """
+        Default queue processing for transports that hand jobs off to an
+        external scheduler (BOINC, CONDOR): just wait until maxtime.
+
+        If return_on_completion is set, poll every mintime seconds instead and
+        return as soon as a job not previously known to be done completes, so
+        that the caller can harvest it and relaunch without waiting for the
+        full cycle.
+        """
+        if not return_on_completion:
+            time.sleep(maxtime)
+            return
+        done = self._completedJobs()
+        usetime = 0
+        while usetime < maxtime:
+            time.sleep(mintime)
+            usetime += mintime
+            self.poll()
+            if self._completedJobs() - done:
+                return
+
+    def _completedJobs(self):
+        """
+        Returns the set of ids of tracked jobs known to be complete.
+        """
+        return set()
+
@@ -39,6 +39,10 @@ status_file = outfile
 f = open(status_file,'w')
 pickle.dump(status,f)
 f.close()
+# drop the status journal, it would be replayed on top of the restored state
+journal_file = status_file + '.journal'
+if os.path.exists(journal_file):
+    os.remove(journal_file)
 
 #wuid_file = 'cyfipmE_boinc.stat'
 replica_to_wuid = [ None for k in range(nreplicas)]